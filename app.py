@@ -1,22 +1,29 @@
-import csv
-import io
-import json
+import mimetypes
 import os
+import random
+import re
+import threading
 import time
 import uuid
 
 import dictionary
-import requests
 import x
-from flask import Flask, jsonify, redirect, render_template, request, session, url_for
-from flask_session import Session
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import Flask, g, jsonify, make_response, redirect, render_template, request, send_file, session, url_for
+from markupsafe import Markup
+from werkzeug.security import check_password_hash, generate_password_hash, safe_join
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
-app.config["SESSION_TYPE"] = "filesystem"
 app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key")
-Session(app)
+app.config["USE_X_SENDFILE"] = x.MEDIA_OFFLOAD == "sendfile"
+app.session_interface = x.SqlSessionInterface()
+app.add_template_global(x.encode_cursor, "encode_cursor")
+app.add_template_global(x.media_url, "media_url")
+app.add_template_global(x.image_srcset, "image_srcset")
+app.add_template_global(x.variant_path, "variant_path")
+app.add_template_global(x.static_url, "static_url")
+app.after_request(x.sql_report)
+app.teardown_appcontext(x.release_db)
 
 
 ##############################
@@ -25,13 +32,119 @@ Session(app)
 def set_language(lan: str | None = None):
     if lan in x.allowed_languages:
         session["lan"] = lan
-        x.set_language(lan)
-    return session.get("lan", x.allowed_languages[0])
+    return x.set_language(session.get("lan", x.default_language))
+
+
+# Only what templates and routes read; secrets like reset keys never leave the login query
+USER_COLUMNS = """
+    user_pk, user_email, user_username, user_first_name, user_last_name, user_avatar_path, user_avatar_variants, user_bio,
+    user_role, user_blocked_at, user_version, user_created_at
+"""
+identity_cache = x.LRUCache(x.IDENTITY_CACHE_MAX_ITEMS, ttl=x.IDENTITY_CACHE_TTL)
+
+
+def load_user(user_pk):
+    user = identity_cache.get(user_pk)
+    if user is None:
+        db, cursor = x.db()
+        try:
+            cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE user_pk = %s", (user_pk,))
+            user = cursor.fetchone()
+        finally:
+            cursor.close()
+            db.close()
+        if user:
+            identity_cache.set(user_pk, user)
+    return user
+
+
+def current_user():
+    """
+    Returns the logged-in user's row, or None.
+    The session only holds user_pk and user_version; a version bump (password reset, block) ends every session.
+    """
+    if "current_user" not in g:
+        user_pk = session.get("user_pk")
+        user = load_user(user_pk) if user_pk else None
+        if user_pk and (not user or user["user_version"] != session.get("user_version")):
+            session.clear()
+            user = None
+        g.current_user = user
+    return g.current_user
+
+
+def forget_user(user_pk):
+    identity_cache.delete(user_pk)
+    g.pop("current_user", None)
 
 
 @app.context_processor
 def inject_globals():
-    return dict(dictionary=dictionary, lan=session.get("lan", "english"), session_user=session.get("user"))
+    return dict(dictionary=dictionary, lan=x.get_language(), session_user=current_user())
+
+
+##############################
+# FRAGMENT CACHE
+##############################
+post_card_cache = x.LRUCache(x.FRAGMENT_CACHE_MAX_ITEMS, x.FRAGMENT_CACHE_MAX_BYTES)
+VIEWER_SLOT = re.compile(r"<!--viewer:(like|post-actions|comment-actions):([0-9A-Za-z]+):([0-9A-Za-z]*)-->")
+
+
+def apply_viewer_overlay(html, user, posts_by_pk=None):
+    """
+    Fills the per-viewer slots of a shared fragment: the like button (state and count)
+    and the edit/delete buttons that only owners and admins see.
+    """
+    posts_by_pk = posts_by_pk or {}
+    is_admin = bool(user) and user.get("user_role") == "admin"
+
+    def fill(match):
+        slot, pk, owner_pk = match.groups()
+        if slot == "like":
+            post = posts_by_pk.get(pk, {"post_pk": pk})
+            return app.jinja_env.get_template("components/like_button.html").render(post=post)
+        if not user or (owner_pk != user["user_pk"] and not is_admin):
+            return ""
+        template = "components/post_actions.html" if slot == "post-actions" else "components/comment_actions.html"
+        return app.jinja_env.get_template(template).render(pk=pk)
+
+    return Markup(VIEWER_SLOT.sub(fill, html))
+
+
+def render_post_cards(cursor, posts, user, lan):
+    """
+    Renders post cards through the fragment cache. Entries are keyed by post id, post_version,
+    author details and language; comments are only fetched for the cards that miss.
+    Commenters' names and avatars are covered by post_version: bump_commented_posts() runs when they change.
+    """
+    keys = {
+        post["post_pk"]: (post["post_pk"], post.get("post_version", 0), post["user_username"], post["user_first_name"], post["user_last_name"], post["user_avatar_path"], post.get("user_avatar_variants", ""), lan)
+        for post in posts
+    }
+    cached = {pk: post_card_cache.get(key) for pk, key in keys.items()}
+    misses = [post for post in posts if cached[post["post_pk"]] is None]
+    if misses:
+        comments_map = get_comments_map(cursor, misses) if cursor else {}
+        for post in misses:
+            html = render_template("components/post_card.html", post=post, comments=comments_map.get(post["post_pk"], []), lan=lan)
+            post_card_cache.set(keys[post["post_pk"]], html)
+            cached[post["post_pk"]] = html
+    posts_by_pk = {post["post_pk"]: post for post in posts}
+    return [apply_viewer_overlay(cached[post["post_pk"]], user, posts_by_pk) for post in posts]
+
+
+def bump_commented_posts(cursor, user_pk):
+    """
+    Bumps post_version on every post the user has commented on, so cached cards showing their name or avatar are rebuilt.
+    """
+    cursor.execute(
+        """
+        UPDATE posts p
+        JOIN (SELECT DISTINCT comment_post_fk FROM comments WHERE comment_user_fk = %s) c ON c.comment_post_fk = p.post_pk
+        SET p.post_version = p.post_version + 1
+        """,
+        (user_pk,),
+    )
 
 
 ##############################
@@ -47,7 +160,7 @@ def set_lang(lan="english"):
 @app.get("/<lan>")
 def index(lan=None):
     set_language(lan)
-    if session.get("user"):
+    if current_user():
         return redirect(url_for("home"))
     return render_template("index.html")
 
@@ -56,7 +169,7 @@ def index(lan=None):
 @app.get("/login/<lan>")
 def view_login(lan=None):
     lan = set_language(lan)
-    if session.get("user"):
+    if current_user():
         return redirect(url_for("home"))
     return render_template("login.html", error=None)
 
@@ -79,8 +192,9 @@ def login(lan=None):
             raise Exception(dictionary.user_not_verified[lan], 400)
         if not check_password_hash(user["user_password"], user_password):
             raise Exception(dictionary.invalid_credentials[lan], 400)
-        user.pop("user_password")
-        session["user"] = user
+        session.clear()
+        session["user_pk"] = user["user_pk"]
+        session["user_version"] = user["user_version"]
         return redirect(url_for("home"))
     except Exception as ex:
         msg = ex.args[0] if ex.args else "System under maintenance"
@@ -97,7 +211,7 @@ def login(lan=None):
 @app.get("/signup/<lan>")
 def view_signup(lan=None):
     lan = set_language(lan)
-    if session.get("user"):
+    if current_user():
         return redirect(url_for("home"))
     return render_template("signup.html", error=None)
 
@@ -137,6 +251,10 @@ def signup(lan=None):
             ),
         )
         db.commit()
+        bump_search_version()
+        typeahead_index.add(
+            {"user_pk": user_pk, "user_username": user_username, "user_first_name": user_first_name, "user_last_name": user_last_name, "user_avatar_path": avatar_path}
+        )
 
         verify_html = render_template("_email_verify_account.html", user_verification_key=verification_key)
         x.send_email(user_email, "Verify your VinylVibes account", verify_html)
@@ -247,10 +365,11 @@ def reset_password(reset_key):
             raise Exception(dictionary.invalid_reset[lan], 400)
 
         cursor.execute(
-            "UPDATE users SET user_password = %s, user_reset_key = '', user_reset_expires = 0 WHERE user_pk = %s",
+            "UPDATE users SET user_password = %s, user_reset_key = '', user_reset_expires = 0, user_version = user_version + 1 WHERE user_pk = %s",
             (generate_password_hash(new_password), user["user_pk"]),
         )
         db.commit()
+        forget_user(user["user_pk"])
         return redirect(url_for("view_login"))
     except Exception as ex:
         if "db" in locals():
@@ -268,60 +387,398 @@ def reset_password(reset_key):
 ##############################
 # HOME / FEED
 ##############################
-@app.get("/home")
-def home():
-    lan = set_language()
-    user = session.get("user")
-    if not user or user.get("user_blocked_at", 0):
-        return redirect(url_for("view_login"))
+# Like count of the post aliased p: the counter column plus deltas of a hot post not yet folded in by fold_like_shards()
+LIKE_TOTAL_SQL = "GREATEST(CAST(p.post_total_likes AS SIGNED) + IFNULL((SELECT SUM(shard_delta) FROM post_like_shards WHERE shard_post_fk = p.post_pk), 0), 0)"
+
+FEED_SELECT = f"""
+    SELECT p.*, u.user_username, u.user_first_name, u.user_last_name, u.user_avatar_path, u.user_avatar_variants,
+        {LIKE_TOTAL_SQL} AS like_count,
+        EXISTS(SELECT 1 FROM post_likes WHERE like_post_fk=p.post_pk AND like_user_fk=%s) AS liked_by_me,
+        p.post_total_comments AS comment_count
+    FROM posts p
+    JOIN users u ON u.user_pk = p.post_user_fk
+"""
+
+
+def get_comments_map(cursor, posts):
+    """
+    Returns the latest COMMENT_PREVIEW_LIMIT comments per post, newest first.
+    Older comments are paged in through /api/posts/<post_pk>/comments.
+    """
+    post_ids = [p["post_pk"] for p in posts if p.get("comment_count")]
+    comments_map = {}
+    if post_ids:
+        placeholders = ",".join(["%s"] * len(post_ids))
+        cursor.execute(
+            f"""
+            SELECT * FROM (
+                SELECT c.*, u.user_username, u.user_first_name, u.user_avatar_path, u.user_avatar_variants,
+                    ROW_NUMBER() OVER (PARTITION BY c.comment_post_fk ORDER BY c.comment_created_at DESC, c.comment_pk DESC) AS comment_rank
+                FROM comments c
+                JOIN users u ON u.user_pk = c.comment_user_fk
+                WHERE c.comment_post_fk IN ({placeholders})
+            ) ranked
+            WHERE comment_rank <= %s
+            ORDER BY comment_post_fk, comment_rank
+            """,
+            (*post_ids, x.COMMENT_PREVIEW_LIMIT),
+        )
+        for comment in cursor.fetchall():
+            comments_map.setdefault(comment["comment_post_fk"], []).append(comment)
+    return comments_map
+
+
+def keyset_clause(created_column, pk_column, after):
+    if not after:
+        return "", ()
+    return f"AND ({created_column} < %s OR ({created_column} = %s AND {pk_column} < %s))", (after[0], after[0], after[1])
+
+
+def get_feed_page(cursor, user_pk, after=None, tab="latest"):
+    """
+    Returns (posts, next_cursor) for one page of the latest or following feed.
+    Uses keyset pagination on (post_created_at, post_pk) so deep pages cost the same as the first.
+    """
+    if tab == "following":
+        posts = get_following_posts(cursor, user_pk, after)
+    else:
+        keyset, params = keyset_clause("p.post_created_at", "p.post_pk", after)
+        cursor.execute(
+            f"""
+            {FEED_SELECT}
+            WHERE p.post_blocked_at = 0 {keyset}
+            ORDER BY p.post_created_at DESC, p.post_pk DESC
+            LIMIT %s
+            """,
+            (user_pk, *params, x.FEED_PAGE_SIZE + 1),
+        )
+        posts = cursor.fetchall()
+    next_cursor = None
+    if len(posts) > x.FEED_PAGE_SIZE:
+        posts = posts[: x.FEED_PAGE_SIZE]
+        next_cursor = x.encode_cursor(posts[-1]["post_created_at"], posts[-1]["post_pk"])
+    return posts, next_cursor
+
+
+##############################
+# TIMELINES
+##############################
+def get_following_posts(cursor, user_pk, after=None):
+    """
+    Reads the materialized timeline and merges in posts from followed accounts
+    that are too big to fan out (user_total_followers > FANOUT_MAX_FOLLOWERS).
+    """
+    keyset, params = keyset_clause("t.timeline_post_created_at", "t.timeline_post_fk", after)
+    cursor.execute(
+        f"""
+        {FEED_SELECT}
+        JOIN timelines t ON t.timeline_post_fk = p.post_pk
+        WHERE t.timeline_user_fk = %s AND p.post_blocked_at = 0 {keyset}
+        ORDER BY t.timeline_post_created_at DESC, t.timeline_post_fk DESC
+        LIMIT %s
+        """,
+        (user_pk, user_pk, *params, x.FEED_PAGE_SIZE + 1),
+    )
+    posts = {post["post_pk"]: post for post in cursor.fetchall()}
+
+    keyset, params = keyset_clause("p.post_created_at", "p.post_pk", after)
+    cursor.execute(
+        f"""
+        {FEED_SELECT}
+        JOIN follows f ON f.follow_following_fk = p.post_user_fk AND f.follow_follower_fk = %s
+        WHERE u.user_total_followers > %s AND p.post_blocked_at = 0 {keyset}
+        ORDER BY p.post_created_at DESC, p.post_pk DESC
+        LIMIT %s
+        """,
+        (user_pk, user_pk, x.FANOUT_MAX_FOLLOWERS, *params, x.FEED_PAGE_SIZE + 1),
+    )
+    for post in cursor.fetchall():
+        posts.setdefault(post["post_pk"], post)
+
+    merged = sorted(posts.values(), key=lambda p: (p["post_created_at"], p["post_pk"]), reverse=True)
+    return merged[: x.FEED_PAGE_SIZE + 1]
+
+
+def fan_out_post(post_pk, author_pk, created_at):
+    """
+    Background job: copies a new post into the author's and every follower's timeline.
+    Authors above FANOUT_MAX_FOLLOWERS are skipped; their followers merge on read.
+    """
+    db, cursor = x.db()
     try:
-        db, cursor = x.db()
+        cursor.execute(
+            "INSERT IGNORE INTO timelines (timeline_user_fk, timeline_post_fk, timeline_author_fk, timeline_post_created_at) VALUES (%s, %s, %s, %s)",
+            (author_pk, post_pk, author_pk, created_at),
+        )
         cursor.execute(
             """
-            SELECT p.*, u.user_username, u.user_first_name, u.user_last_name, u.user_avatar_path,
-                IFNULL((SELECT COUNT(*) FROM post_likes WHERE like_post_fk=p.post_pk),0) AS like_count,
-                EXISTS(SELECT 1 FROM post_likes WHERE like_post_fk=p.post_pk AND like_user_fk=%s) AS liked_by_me,
-                IFNULL((SELECT COUNT(*) FROM comments WHERE comment_post_fk=p.post_pk),0) AS comment_count
-            FROM posts p
-            JOIN users u ON u.user_pk = p.post_user_fk
-            WHERE (p.post_blocked_at = 0)
+            INSERT IGNORE INTO timelines (timeline_user_fk, timeline_post_fk, timeline_author_fk, timeline_post_created_at)
+            SELECT f.follow_follower_fk, %s, %s, %s
+            FROM follows f
+            JOIN users u ON u.user_pk = f.follow_following_fk
+            WHERE f.follow_following_fk = %s AND u.user_total_followers <= %s
+            """,
+            (post_pk, author_pk, created_at, author_pk, x.FANOUT_MAX_FOLLOWERS),
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
+
+
+def backfill_timeline(follower_pk, author_pk):
+    """
+    Background job: copies the author's latest posts into a new follower's timeline.
+    """
+    db, cursor = x.db()
+    try:
+        cursor.execute(
+            """
+            INSERT IGNORE INTO timelines (timeline_user_fk, timeline_post_fk, timeline_author_fk, timeline_post_created_at)
+            SELECT f.follow_follower_fk, p.post_pk, p.post_user_fk, p.post_created_at
+            FROM follows f
+            JOIN users u ON u.user_pk = f.follow_following_fk
+            JOIN posts p ON p.post_user_fk = f.follow_following_fk
+            WHERE f.follow_follower_fk = %s AND f.follow_following_fk = %s
+              AND u.user_total_followers <= %s AND p.post_blocked_at = 0
             ORDER BY p.post_created_at DESC
-            LIMIT 50
+            LIMIT %s
             """,
-            (user["user_pk"],),
+            (follower_pk, author_pk, x.FANOUT_MAX_FOLLOWERS, x.TIMELINE_BACKFILL),
         )
-        posts = cursor.fetchall()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
 
-        post_ids = [p["post_pk"] for p in posts]
-        comments_map = {}
-        if post_ids:
-            placeholders = ",".join(["%s"] * len(post_ids))
-            cursor.execute(
-                f"""
-                SELECT c.*, u.user_username, u.user_first_name, u.user_avatar_path
-                FROM comments c
-                JOIN users u ON u.user_pk = c.comment_user_fk
-                WHERE c.comment_post_fk IN ({placeholders})
-                ORDER BY c.comment_created_at DESC
-                """,
-                tuple(post_ids),
-            )
-            for comment in cursor.fetchall():
-                comments_map.setdefault(comment["comment_post_fk"], []).append(comment)
 
+def backfill_followers(author_pk):
+    """
+    Background job for an author who just dropped to FANOUT_MAX_FOLLOWERS: their followers stop merging
+    the author's posts on read, so the latest TIMELINE_BACKFILL posts are copied into every follower's timeline.
+    """
+    db, cursor = x.db()
+    try:
         cursor.execute(
             """
-            SELECT user_pk, user_username, user_first_name, user_last_name, user_avatar_path,
-                   EXISTS(SELECT 1 FROM follows WHERE follow_follower_fk=%s AND follow_following_fk=user_pk) AS following
-            FROM users
-            WHERE user_pk != %s AND user_blocked_at = 0
-            ORDER BY RAND() LIMIT 5
+            INSERT IGNORE INTO timelines (timeline_user_fk, timeline_post_fk, timeline_author_fk, timeline_post_created_at)
+            SELECT f.follow_follower_fk, p.post_pk, p.post_user_fk, p.post_created_at
+            FROM follows f
+            JOIN users u ON u.user_pk = f.follow_following_fk
+            JOIN (
+                SELECT post_pk, post_user_fk, post_created_at FROM posts
+                WHERE post_user_fk = %s AND post_blocked_at = 0
+                ORDER BY post_created_at DESC
+                LIMIT %s
+            ) p ON p.post_user_fk = f.follow_following_fk
+            WHERE f.follow_following_fk = %s AND u.user_total_followers <= %s
             """,
-            (user["user_pk"], user["user_pk"]),
+            (author_pk, x.TIMELINE_BACKFILL, author_pk, x.FANOUT_MAX_FOLLOWERS),
         )
-        suggestions = cursor.fetchall()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
 
-        return render_template("home.html", posts=posts, comments_map=comments_map, suggestions=suggestions)
+
+def prune_timeline(follower_pk, author_pk):
+    """
+    Background job: removes an unfollowed author's posts from the follower's timeline.
+    """
+    db, cursor = x.db()
+    try:
+        cursor.execute(
+            """
+            DELETE FROM timelines
+            WHERE timeline_user_fk = %s AND timeline_author_fk = %s
+              AND NOT EXISTS (SELECT 1 FROM follows WHERE follow_follower_fk = %s AND follow_following_fk = %s)
+            """,
+            (follower_pk, author_pk, follower_pk, author_pk),
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
+
+
+##############################
+# SUGGESTIONS
+##############################
+# user_pk -> True while the stored suggestions count as fresh in this process; expiry triggers the next full refresh
+_suggestions_refreshed = x.LRUCache(x.SUGGESTION_TRACKED_USERS, ttl=x.SUGGESTION_REFRESH_INTERVAL)
+MUTUAL_WEIGHT = 1_000_000  # one mutual follow outranks any follower count
+
+
+def refresh_suggestions(user_pk):
+    """
+    Background job: recomputes the stored "who to follow" candidates for one user.
+    Friends-of-friends rank by mutual follows, then popular accounts fill the rest.
+    """
+    _suggestions_refreshed.set(user_pk, True)
+    db, cursor = x.db()
+    try:
+        cursor.execute(
+            """
+            SELECT f2.follow_following_fk AS target_pk, COUNT(*) AS mutuals, u.user_total_followers
+            FROM follows f1
+            JOIN follows f2 ON f2.follow_follower_fk = f1.follow_following_fk
+            JOIN users u ON u.user_pk = f2.follow_following_fk AND u.user_blocked_at = 0
+            WHERE f1.follow_follower_fk = %s AND f2.follow_following_fk != %s
+              AND NOT EXISTS (SELECT 1 FROM follows f3 WHERE f3.follow_follower_fk = %s AND f3.follow_following_fk = f2.follow_following_fk)
+            GROUP BY f2.follow_following_fk, u.user_total_followers
+            ORDER BY mutuals DESC
+            LIMIT %s
+            """,
+            (user_pk, user_pk, user_pk, x.SUGGESTION_POOL_SIZE),
+        )
+        candidates = {row["target_pk"]: row["mutuals"] * MUTUAL_WEIGHT + min(row["user_total_followers"], MUTUAL_WEIGHT - 1) for row in cursor.fetchall()}
+        if len(candidates) < x.SUGGESTION_POOL_SIZE:
+            cursor.execute(
+                """
+                SELECT user_pk, user_total_followers
+                FROM users
+                WHERE user_pk != %s AND user_blocked_at = 0
+                  AND NOT EXISTS (SELECT 1 FROM follows WHERE follow_follower_fk = %s AND follow_following_fk = user_pk)
+                ORDER BY user_total_followers DESC
+                LIMIT %s
+                """,
+                (user_pk, user_pk, x.SUGGESTION_POOL_SIZE),
+            )
+            for row in cursor.fetchall():
+                if len(candidates) >= x.SUGGESTION_POOL_SIZE:
+                    break
+                candidates.setdefault(row["user_pk"], min(row["user_total_followers"], MUTUAL_WEIGHT - 1))
+
+        now = int(time.time())
+        cursor.execute("DELETE FROM suggestions WHERE suggestion_user_fk = %s", (user_pk,))
+        if candidates:
+            values = ",".join(["(%s, %s, %s, %s)"] * len(candidates))
+            params = [value for target_pk, score in candidates.items() for value in (user_pk, target_pk, score, now)]
+            cursor.execute(
+                f"INSERT INTO suggestions (suggestion_user_fk, suggestion_target_fk, suggestion_score, suggestion_created_at) VALUES {values}",
+                tuple(params),
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
+
+
+def apply_follow_to_suggestions(user_pk, target_pk, following):
+    """
+    Background job after a follow or unfollow: adjusts the stored candidates instead of recomputing them.
+    Following target_pk adds a mutual to every account target_pk follows; unfollowing takes it away again.
+    """
+    db, cursor = x.db()
+    try:
+        if following:
+            cursor.execute(
+                """
+                INSERT INTO suggestions (suggestion_user_fk, suggestion_target_fk, suggestion_score, suggestion_created_at)
+                SELECT %s, f.follow_following_fk, %s + LEAST(u.user_total_followers, %s), %s
+                FROM follows f
+                JOIN users u ON u.user_pk = f.follow_following_fk AND u.user_blocked_at = 0
+                WHERE f.follow_follower_fk = %s AND f.follow_following_fk != %s
+                  AND NOT EXISTS (SELECT 1 FROM follows mine WHERE mine.follow_follower_fk = %s AND mine.follow_following_fk = f.follow_following_fk)
+                ORDER BY u.user_total_followers DESC
+                LIMIT %s
+                ON DUPLICATE KEY UPDATE suggestion_score = suggestion_score + %s
+                """,
+                (user_pk, MUTUAL_WEIGHT, MUTUAL_WEIGHT - 1, int(time.time()), target_pk, user_pk, user_pk, x.SUGGESTION_POOL_SIZE, MUTUAL_WEIGHT),
+            )
+            # Trim back to the pool size so the table stays bounded per user
+            cursor.execute(
+                "SELECT suggestion_score FROM suggestions WHERE suggestion_user_fk = %s ORDER BY suggestion_score DESC LIMIT 1 OFFSET %s",
+                (user_pk, x.SUGGESTION_POOL_SIZE - 1),
+            )
+            cutoff = cursor.fetchone()
+            if cutoff:
+                cursor.execute("DELETE FROM suggestions WHERE suggestion_user_fk = %s AND suggestion_score < %s", (user_pk, cutoff["suggestion_score"]))
+        else:
+            cursor.execute(
+                """
+                UPDATE suggestions s
+                JOIN follows f ON f.follow_following_fk = s.suggestion_target_fk AND f.follow_follower_fk = %s
+                SET s.suggestion_score = s.suggestion_score - %s
+                WHERE s.suggestion_user_fk = %s AND s.suggestion_score >= %s
+                """,
+                (target_pk, MUTUAL_WEIGHT, user_pk, MUTUAL_WEIGHT),
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
+
+
+def get_suggestions(cursor, user_pk):
+    """
+    Reads the precomputed suggestions; falls back to the most followed accounts
+    and schedules a refresh when none are stored yet or they have gone stale.
+    """
+    if _suggestions_refreshed.get(user_pk) is None:
+        _suggestions_refreshed.set(user_pk, True)
+        x.run_in_background(refresh_suggestions, user_pk)
+    cursor.execute(
+        """
+        SELECT u.user_pk, u.user_username, u.user_first_name, u.user_last_name, u.user_avatar_path, u.user_avatar_variants, 0 AS following
+        FROM suggestions s
+        JOIN users u ON u.user_pk = s.suggestion_target_fk
+        WHERE s.suggestion_user_fk = %s AND u.user_blocked_at = 0
+        ORDER BY s.suggestion_score DESC
+        LIMIT %s
+        """,
+        (user_pk, x.SUGGESTIONS_SHOWN),
+    )
+    suggestions = cursor.fetchall()
+    if suggestions:
+        return suggestions
+    cursor.execute(
+        """
+        SELECT user_pk, user_username, user_first_name, user_last_name, user_avatar_path, user_avatar_variants,
+               EXISTS(SELECT 1 FROM follows WHERE follow_follower_fk=%s AND follow_following_fk=user_pk) AS following
+        FROM users
+        WHERE user_pk != %s AND user_blocked_at = 0
+        ORDER BY user_total_followers DESC
+        LIMIT %s
+        """,
+        (user_pk, user_pk, x.SUGGESTIONS_SHOWN),
+    )
+    return cursor.fetchall()
+
+
+@app.get("/home")
+def home():
+    lan = set_language()
+    user = current_user()
+    if not user or user.get("user_blocked_at", 0):
+        return redirect(url_for("view_login"))
+    try:
+        tab = "following" if request.args.get("tab") == "following" else "latest"
+        db, cursor = x.db()
+        posts, next_cursor = get_feed_page(cursor, user["user_pk"], tab=tab)
+        cards = render_post_cards(cursor, posts, user, lan)
+
+        suggestions = get_suggestions(cursor, user["user_pk"])
+
+        return render_template("home.html", cards=cards, next_cursor=next_cursor, tab=tab, suggestions=suggestions)
     except Exception as ex:
         print("HOME ERROR:", ex, flush=True)
         return "System under maintenance", 500
@@ -332,31 +789,61 @@ def home():
             db.close()
 
 
+@app.get("/api/feed")
+def api_feed():
+    lan = set_language()
+    user = current_user()
+    if not user or user.get("user_blocked_at", 0):
+        return jsonify({"status": "error", "message": "Login required"}), 401
+    try:
+        after = x.validate_cursor(request.args.get("after", ""), "cursor", lan) if request.args.get("after") else None
+        tab = "following" if request.args.get("tab") == "following" else "latest"
+        db, cursor = x.db()
+        posts, next_cursor = get_feed_page(cursor, user["user_pk"], after, tab)
+        html = "".join(render_post_cards(cursor, posts, user, lan))
+        return jsonify({"status": "ok", "html": html, "next": next_cursor or ""})
+    except Exception as ex:
+        msg = ex.args[0] if ex.args else "System under maintenance"
+        status = ex.args[1] if len(ex.args) > 1 else 500
+        return jsonify({"status": "error", "message": msg}), status
+    finally:
+        if "cursor" in locals():
+            cursor.close()
+        if "db" in locals():
+            db.close()
+
+
 ##############################
 # POSTS
 ##############################
 @app.post("/api/posts")
 def create_post():
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
         message = x.validate_post(lan)
         media = request.files.get("media")
-        media_path = x.save_upload(media, x.UPLOAD_MEDIA_FOLDER, prefix="post")
+        media_path = x.save_upload(media, x.UPLOAD_MEDIA_FOLDER)
         post_pk = uuid.uuid4().hex
+        now = int(time.time())
         db, cursor = x.db()
         cursor.execute(
-            "INSERT INTO posts (post_pk, post_user_fk, post_message, post_total_likes, post_image_path, post_blocked_at, post_created_at) VALUES (%s, %s, %s, 0, %s, 0, %s)",
-            (post_pk, user["user_pk"], message, media_path, int(time.time())),
+            "INSERT INTO posts (post_pk, post_user_fk, post_message, post_total_likes, post_total_comments, post_image_path, post_blocked_at, post_created_at) VALUES (%s, %s, %s, 0, 0, %s, 0, %s)",
+            (post_pk, user["user_pk"], message, media_path, now),
         )
+        x.add_upload_ref(cursor, media_path)
         db.commit()
+        x.run_in_background(fan_out_post, post_pk, user["user_pk"], now)
+        x.process_image(media_path, x.IMAGE_WIDTHS, lambda info: save_post_image(post_pk, info))
+        bump_search_version()
         post = {
             "post_pk": post_pk,
             "post_user_fk": user["user_pk"],
             "post_message": message,
             "post_total_likes": 0,
+            "post_total_comments": 0,
             "post_image_path": media_path,
             "liked_by_me": 0,
             "like_count": 0,
@@ -365,8 +852,9 @@ def create_post():
             "user_last_name": user["user_last_name"],
             "user_username": user["user_username"],
             "user_avatar_path": user["user_avatar_path"],
+            "user_avatar_variants": user["user_avatar_variants"],
         }
-        html = render_template("components/post_card.html", post=post, comments=[], session_user=user, lan=lan)
+        html = render_post_cards(None, [post], user, lan)[0]
         return jsonify({"status": "ok", "html": html, "message": dictionary.post_created[lan]})
     except Exception as ex:
         if "db" in locals():
@@ -381,10 +869,29 @@ def create_post():
             db.close()
 
 
+def save_post_image(post_pk, info):
+    """
+    Records the variants built by x.process_image; the version bump re-renders cached cards with srcset.
+    """
+    db, cursor = x.db()
+    try:
+        cursor.execute(
+            """
+            UPDATE posts SET post_image_width = %s, post_image_height = %s, post_image_variants = %s, post_version = post_version + 1
+            WHERE post_pk = %s
+            """,
+            (info["width"], info["height"], info["variants"], post_pk),
+        )
+        db.commit()
+    finally:
+        cursor.close()
+        db.close()
+
+
 @app.patch("/api/posts/<post_pk>")
 def update_post(post_pk):
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
@@ -397,8 +904,9 @@ def update_post(post_pk):
             raise Exception(dictionary.post_not_found[lan], 404)
         if owner["post_user_fk"] != user["user_pk"] and user["user_role"] != "admin":
             raise Exception(dictionary.not_allowed[lan], 403)
-        cursor.execute("UPDATE posts SET post_message = %s WHERE post_pk = %s", (message, post_pk))
+        cursor.execute("UPDATE posts SET post_message = %s, post_version = post_version + 1 WHERE post_pk = %s", (message, post_pk))
         db.commit()
+        bump_search_version()
         return jsonify({"status": "ok", "message": dictionary.post_updated[lan]})
     except Exception as ex:
         if "db" in locals():
@@ -416,22 +924,25 @@ def update_post(post_pk):
 @app.delete("/api/posts/<post_pk>")
 def delete_post(post_pk):
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
         post_pk = x.validate_uuid(post_pk, "post", lan)
         db, cursor = x.db()
-        cursor.execute("SELECT post_user_fk FROM posts WHERE post_pk = %s", (post_pk,))
+        cursor.execute("SELECT post_user_fk, post_image_path FROM posts WHERE post_pk = %s", (post_pk,))
         owner = cursor.fetchone()
         if not owner:
             raise Exception(dictionary.post_not_found[lan], 404)
         if owner["post_user_fk"] != user["user_pk"] and user["user_role"] != "admin":
             raise Exception(dictionary.not_allowed[lan], 403)
+        x.drop_upload_ref(cursor, owner["post_image_path"])
         cursor.execute("DELETE FROM comments WHERE comment_post_fk = %s", (post_pk,))
         cursor.execute("DELETE FROM post_likes WHERE like_post_fk = %s", (post_pk,))
+        cursor.execute("DELETE FROM timelines WHERE timeline_post_fk = %s", (post_pk,))
         cursor.execute("DELETE FROM posts WHERE post_pk = %s", (post_pk,))
         db.commit()
+        bump_search_version()
         return jsonify({"status": "ok", "message": dictionary.post_deleted[lan]})
     except Exception as ex:
         if "db" in locals():
@@ -446,27 +957,165 @@ def delete_post(post_pk):
             db.close()
 
 
+like_tracker = x.HotKeyTracker(x.LIKE_SHARD_THRESHOLD, x.LIKE_SHARD_WINDOW, x.LIKE_SHARD_HOT_SECONDS)
+
+
+def fold_like_shards():
+    """
+    Periodic job: folds the sharded like deltas of hot posts back into posts.post_total_likes, LIKE_SHARD_FOLD_BATCH posts per transaction.
+    Readers add unfolded deltas through LIKE_TOTAL_SQL, so counts are right between folds and across workers.
+    """
+    db, cursor = x.db()
+    try:
+        cursor.execute("SELECT DISTINCT shard_post_fk FROM post_like_shards ORDER BY shard_post_fk")
+        post_pks = [row["shard_post_fk"] for row in cursor.fetchall()]
+        db.commit()
+        for start in range(0, len(post_pks), x.LIKE_SHARD_FOLD_BATCH):
+            batch = post_pks[start : start + x.LIKE_SHARD_FOLD_BATCH]
+            for attempt in range(x.DB_DEADLOCK_RETRIES):
+                try:
+                    fold_like_batch(cursor, batch)
+                    db.commit()
+                    break
+                except Exception as ex:
+                    db.rollback()
+                    if not x.is_deadlock(ex) or attempt == x.DB_DEADLOCK_RETRIES - 1:
+                        raise
+    finally:
+        cursor.close()
+        db.close()
+
+
+def fold_like_batch(cursor, post_pks):
+    """
+    Folds the shards of a few posts (sorted by pk) inside the caller's transaction.
+    Locks are taken in the same order as toggle_like: the posts rows first (its INSERT into post_likes takes an FK lock on them), then their shards.
+    """
+    placeholders = ", ".join(["%s"] * len(post_pks))
+    cursor.execute(f"SELECT post_pk FROM posts WHERE post_pk IN ({placeholders}) ORDER BY post_pk FOR UPDATE", post_pks)
+    cursor.fetchall()
+    cursor.execute(f"SELECT shard_post_fk, shard_delta FROM post_like_shards WHERE shard_post_fk IN ({placeholders}) FOR UPDATE", post_pks)
+    deltas = {}
+    for row in cursor.fetchall():
+        deltas[row["shard_post_fk"]] = deltas.get(row["shard_post_fk"], 0) + int(row["shard_delta"])
+    for post_pk in sorted(deltas):
+        cursor.execute(
+            "UPDATE posts SET post_total_likes = GREATEST(CAST(post_total_likes AS SIGNED) + %s, 0) WHERE post_pk = %s",
+            (deltas[post_pk], post_pk),
+        )
+    cursor.execute(f"DELETE FROM post_like_shards WHERE shard_post_fk IN ({placeholders})", post_pks)
+
+
+@app.post("/api/posts/state")
+def api_posts_state():
+    lan = set_language()
+    user = current_user()
+    if not user or user.get("user_blocked_at", 0):
+        return jsonify({"status": "error", "message": "Login required"}), 401
+    try:
+        payload = request.get_json(silent=True)
+        if payload is not None and not isinstance(payload, dict):
+            raise Exception(dictionary.invalid_uuid[lan], 400)
+        raw_pks = payload.get("post_pks") if payload else request.form.getlist("post_pks")
+        if not isinstance(raw_pks, list) or len(raw_pks) > x.POST_STATE_MAX:
+            raise Exception(dictionary.invalid_uuid[lan], 400)
+        post_pks = list(dict.fromkeys(x.validate_uuid(str(pk), "post", lan) for pk in raw_pks))
+        if not post_pks:
+            return jsonify({"status": "ok", "posts": {}})
+        placeholders = ",".join(["%s"] * len(post_pks))
+        db, cursor = x.db()
+        cursor.execute(
+            f"""
+            SELECT p.post_pk, {LIKE_TOTAL_SQL} AS likes, p.post_total_comments
+            FROM posts p
+            WHERE p.post_pk IN ({placeholders}) AND p.post_blocked_at = 0
+            """,
+            tuple(post_pks),
+        )
+        states = {
+            row["post_pk"]: {"likes": int(row["likes"]), "liked_by_me": False, "comments": row["post_total_comments"]}
+            for row in cursor.fetchall()
+        }
+        cursor.execute(
+            f"SELECT like_post_fk FROM post_likes WHERE like_user_fk = %s AND like_post_fk IN ({placeholders})",
+            (user["user_pk"], *post_pks),
+        )
+        for row in cursor.fetchall():
+            if row["like_post_fk"] in states:
+                states[row["like_post_fk"]]["liked_by_me"] = True
+        return jsonify({"status": "ok", "posts": states})
+    except Exception as ex:
+        msg = ex.args[0] if ex.args else "System under maintenance"
+        status = ex.args[1] if len(ex.args) > 1 else 500
+        return jsonify({"status": "error", "message": msg}), status
+    finally:
+        if "cursor" in locals():
+            cursor.close()
+        if "db" in locals():
+            db.close()
+
+
+def record_like_toggle(cursor, post_pk, user_pk, hot, lan):
+    """
+    Likes or unlikes the post inside the caller's transaction and returns (liked, total).
+    """
+    # uq_like makes the insert the conflict check: a duplicate (or a concurrent double click) is ignored and turns into an unlike.
+    # LAST_INSERT_ID(expr) hands the new counter back in the UPDATE's OK packet, so nothing is re-read or re-aggregated.
+    cursor.execute(
+        "INSERT IGNORE INTO post_likes (like_pk, like_post_fk, like_user_fk, like_created_at) VALUES (%s, %s, %s, %s)",
+        (uuid.uuid4().hex, post_pk, user_pk, int(time.time())),
+    )
+    liked = cursor.rowcount == 1
+    if not liked:
+        cursor.execute("DELETE FROM post_likes WHERE like_post_fk = %s AND like_user_fk = %s", (post_pk, user_pk))
+        if cursor.rowcount != 1:
+            raise Exception(dictionary.post_not_found[lan], 404)
+    if hot:
+        # Hot post: spread the counter over LIKE_SHARD_COUNT rows instead of serializing on the posts row
+        cursor.execute(
+            "INSERT INTO post_like_shards (shard_post_fk, shard_slot, shard_delta) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE shard_delta = shard_delta + VALUES(shard_delta)",
+            (post_pk, random.randrange(x.LIKE_SHARD_COUNT), 1 if liked else -1),
+        )
+        cursor.execute(f"SELECT {LIKE_TOTAL_SQL} AS total FROM posts p WHERE p.post_pk = %s", (post_pk,))
+        total = int(cursor.fetchone()["total"])
+    else:
+        if liked:
+            cursor.execute("UPDATE posts SET post_total_likes = LAST_INSERT_ID(post_total_likes + 1) WHERE post_pk = %s", (post_pk,))
+        else:
+            cursor.execute("UPDATE posts SET post_total_likes = LAST_INSERT_ID(GREATEST(post_total_likes, 1) - 1) WHERE post_pk = %s", (post_pk,))
+        total = cursor.lastrowid
+        # Deltas parked while the post was hot (possibly in another worker) count until the fold moves them over
+        cursor.execute("SELECT IFNULL(SUM(shard_delta), 0) AS delta FROM post_like_shards WHERE shard_post_fk = %s", (post_pk,))
+        total = max(total + int(cursor.fetchone()["delta"]), 0)
+    return liked, total
+
+
 @app.post("/api/posts/<post_pk>/like")
 def toggle_like(post_pk):
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
         post_pk = x.validate_uuid(post_pk, "post", lan)
         db, cursor = x.db()
-        cursor.execute("SELECT like_pk FROM post_likes WHERE like_post_fk = %s AND like_user_fk = %s", (post_pk, user["user_pk"]))
-        existing = cursor.fetchone()
-        if existing:
-            cursor.execute("DELETE FROM post_likes WHERE like_pk = %s", (existing["like_pk"],))
-            liked = False
-        else:
-            cursor.execute("INSERT INTO post_likes (like_pk, like_post_fk, like_user_fk, like_created_at) VALUES (%s, %s, %s, %s)", (uuid.uuid4().hex, post_pk, user["user_pk"], int(time.time())))
-            liked = True
-        cursor.execute("SELECT COUNT(*) AS total FROM post_likes WHERE like_post_fk = %s", (post_pk,))
-        total = cursor.fetchone()["total"]
-        cursor.execute("UPDATE posts SET post_total_likes = %s WHERE post_pk = %s", (total, post_pk))
-        db.commit()
+        hot = like_tracker.hit(post_pk)
+        # Two toggles on one post both hold the FK lock from their post_likes insert before the counter update, so InnoDB
+        # may kill one of them (1213); it is rolled back in full and simply run again.
+        for attempt in range(x.DB_DEADLOCK_RETRIES):
+            try:
+                liked, total = record_like_toggle(cursor, post_pk, user["user_pk"], hot, lan)
+                db.commit()
+                break
+            except Exception as ex:
+                db.rollback()
+                if not x.is_deadlock(ex):
+                    raise
+                if attempt == x.DB_DEADLOCK_RETRIES - 1:
+                    raise Exception("System under maintenance", 503)
+        if hot:
+            # Normally already running from start_background_jobs(); this covers servers started without it
+            x.schedule_periodic("fold_like_shards", x.LIKE_SHARD_FOLD_INTERVAL, fold_like_shards)
         return jsonify({"status": "ok", "liked": liked, "likes": total})
     except Exception as ex:
         if "db" in locals():
@@ -487,7 +1136,7 @@ def toggle_like(post_pk):
 @app.post("/api/posts/<post_pk>/comment")
 def add_comment(post_pk):
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
@@ -499,16 +1148,17 @@ def add_comment(post_pk):
             "INSERT INTO comments (comment_pk, comment_post_fk, comment_user_fk, comment_body, comment_created_at) VALUES (%s, %s, %s, %s, %s)",
             (comment_pk, post_pk, user["user_pk"], comment, int(time.time())),
         )
+        cursor.execute("UPDATE posts SET post_total_comments = post_total_comments + 1, post_version = post_version + 1 WHERE post_pk = %s", (post_pk,))
         db.commit()
         cursor.execute(
             """
-            SELECT c.*, u.user_username, u.user_first_name, u.user_avatar_path
+            SELECT c.*, u.user_username, u.user_first_name, u.user_avatar_path, u.user_avatar_variants
             FROM comments c JOIN users u ON u.user_pk = c.comment_user_fk WHERE c.comment_pk = %s
             """,
             (comment_pk,),
         )
         comment_row = cursor.fetchone()
-        html = render_template("components/comment.html", comment=comment_row, session_user=user)
+        html = apply_viewer_overlay(render_template("components/comment.html", comment=comment_row), user)
         return jsonify({"status": "ok", "html": html, "post_pk": post_pk})
     except Exception as ex:
         if "db" in locals():
@@ -523,10 +1173,50 @@ def add_comment(post_pk):
             db.close()
 
 
+@app.get("/api/posts/<post_pk>/comments")
+def api_comments(post_pk):
+    lan = set_language()
+    user = current_user()
+    if not user or user.get("user_blocked_at", 0):
+        return jsonify({"status": "error", "message": "Login required"}), 401
+    try:
+        post_pk = x.validate_uuid(post_pk, "post", lan)
+        before = x.validate_cursor(request.args.get("before", ""), "cursor", lan) if request.args.get("before") else None
+        keyset, params = keyset_clause("c.comment_created_at", "c.comment_pk", before)
+        db, cursor = x.db()
+        cursor.execute(
+            f"""
+            SELECT c.*, u.user_username, u.user_first_name, u.user_avatar_path, u.user_avatar_variants
+            FROM comments c
+            JOIN users u ON u.user_pk = c.comment_user_fk
+            WHERE c.comment_post_fk = %s {keyset}
+            ORDER BY c.comment_created_at DESC, c.comment_pk DESC
+            LIMIT %s
+            """,
+            (post_pk, *params, x.COMMENT_PAGE_SIZE + 1),
+        )
+        comments = cursor.fetchall()
+        next_cursor = ""
+        if len(comments) > x.COMMENT_PAGE_SIZE:
+            comments = comments[: x.COMMENT_PAGE_SIZE]
+            next_cursor = x.encode_cursor(comments[-1]["comment_created_at"], comments[-1]["comment_pk"])
+        html = "".join(apply_viewer_overlay(render_template("components/comment.html", comment=comment), user) for comment in comments)
+        return jsonify({"status": "ok", "html": html, "next": next_cursor})
+    except Exception as ex:
+        msg = ex.args[0] if ex.args else "System under maintenance"
+        status = ex.args[1] if len(ex.args) > 1 else 500
+        return jsonify({"status": "error", "message": msg}), status
+    finally:
+        if "cursor" in locals():
+            cursor.close()
+        if "db" in locals():
+            db.close()
+
+
 @app.delete("/api/comments/<comment_pk>")
 def delete_comment(comment_pk):
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
@@ -539,6 +1229,10 @@ def delete_comment(comment_pk):
         if row["comment_user_fk"] != user["user_pk"] and user["user_role"] != "admin":
             raise Exception(dictionary.not_allowed[lan], 403)
         cursor.execute("DELETE FROM comments WHERE comment_pk = %s", (comment_pk,))
+        cursor.execute(
+            "UPDATE posts SET post_total_comments = post_total_comments - LEAST(post_total_comments, %s), post_version = post_version + 1 WHERE post_pk = %s",
+            (cursor.rowcount, row["comment_post_fk"]),
+        )
         db.commit()
         return jsonify({"status": "ok", "post_pk": row["comment_post_fk"]})
     except Exception as ex:
@@ -560,7 +1254,7 @@ def delete_comment(comment_pk):
 @app.post("/api/follow/<user_pk>")
 def toggle_follow(user_pk):
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
@@ -572,11 +1266,23 @@ def toggle_follow(user_pk):
         existing = cursor.fetchone()
         if existing:
             cursor.execute("DELETE FROM follows WHERE follow_pk = %s", (existing["follow_pk"],))
+            cursor.execute(
+                "UPDATE users SET user_total_followers = LAST_INSERT_ID(user_total_followers - LEAST(user_total_followers, 1)) WHERE user_pk = %s",
+                (target_pk,),
+            )
+            # Exactly one unfollow sees the count land on the limit: that author switches from merge-on-read to fan-out
+            dropped_to_fanout = cursor.lastrowid == x.FANOUT_MAX_FOLLOWERS
             following = False
         else:
             cursor.execute("INSERT INTO follows (follow_pk, follow_follower_fk, follow_following_fk, follow_created_at) VALUES (%s, %s, %s, %s)", (uuid.uuid4().hex, user["user_pk"], target_pk, int(time.time())))
+            cursor.execute("UPDATE users SET user_total_followers = user_total_followers + 1 WHERE user_pk = %s", (target_pk,))
+            cursor.execute("DELETE FROM suggestions WHERE suggestion_user_fk = %s AND suggestion_target_fk = %s", (user["user_pk"], target_pk))
             following = True
         db.commit()
+        x.run_in_background(backfill_timeline if following else prune_timeline, user["user_pk"], target_pk)
+        if not following and dropped_to_fanout:
+            x.run_in_background(backfill_followers, target_pk)
+        x.run_in_background(apply_follow_to_suggestions, user["user_pk"], target_pk, following)
         return jsonify({"status": "ok", "following": following})
     except Exception as ex:
         if "db" in locals():
@@ -597,7 +1303,7 @@ def toggle_follow(user_pk):
 @app.post("/api/profile")
 def update_profile():
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
@@ -611,16 +1317,11 @@ def update_profile():
             "UPDATE users SET user_email = %s, user_username = %s, user_first_name = %s, user_last_name = %s, user_bio = %s WHERE user_pk = %s",
             (email, username, first_name, last_name, bio, user["user_pk"]),
         )
+        bump_commented_posts(cursor, user["user_pk"])
         db.commit()
-        session["user"].update(
-            {
-                "user_email": email,
-                "user_username": username,
-                "user_first_name": first_name,
-                "user_last_name": last_name,
-                "user_bio": bio,
-            }
-        )
+        forget_user(user["user_pk"])
+        typeahead_index.add(typeahead_record(dict(user, user_username=username, user_first_name=first_name, user_last_name=last_name)))
+        bump_search_version()
         return jsonify({"status": "ok", "message": dictionary.profile_updated[lan]})
     except Exception as ex:
         if "db" in locals():
@@ -640,7 +1341,7 @@ def update_profile():
 @app.get("/profile")
 def profile():
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return redirect(url_for("view_login"))
     return render_template("profile.html", lan=lan, user=user)
@@ -649,19 +1350,26 @@ def profile():
 @app.post("/api/profile/avatar")
 def update_avatar():
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
         avatar = request.files.get("avatar")
-        path = x.save_upload(avatar, x.UPLOAD_AVATAR_FOLDER, {"png", "jpg", "jpeg", "webp", "gif"}, "avatar")
+        path = x.save_upload(avatar, x.UPLOAD_AVATAR_FOLDER, {"png", "jpg", "jpeg", "webp", "gif"})
         if not path:
             raise Exception(dictionary.invalid_avatar[lan], 400)
         db, cursor = x.db()
-        cursor.execute("UPDATE users SET user_avatar_path = %s WHERE user_pk = %s", (path, user["user_pk"]))
+        cursor.execute("SELECT user_avatar_path FROM users WHERE user_pk = %s FOR UPDATE", (user["user_pk"],))
+        x.drop_upload_ref(cursor, cursor.fetchone()["user_avatar_path"])
+        x.add_upload_ref(cursor, path)
+        cursor.execute("UPDATE users SET user_avatar_path = %s, user_avatar_variants = '' WHERE user_pk = %s", (path, user["user_pk"]))
+        bump_commented_posts(cursor, user["user_pk"])
         db.commit()
-        session["user"]["user_avatar_path"] = path
-        return jsonify({"status": "ok", "avatar": f"/{path}"})
+        forget_user(user["user_pk"])
+        x.process_image(path, x.AVATAR_WIDTHS, lambda info: save_avatar_variants(user["user_pk"], path, info))
+        typeahead_index.add(typeahead_record(dict(user, user_avatar_path=path)))
+        bump_search_version()
+        return jsonify({"status": "ok", "avatar": x.media_url(path)})
     except Exception as ex:
         if "db" in locals():
             db.rollback()
@@ -675,20 +1383,91 @@ def update_avatar():
             db.close()
 
 
+def save_avatar_variants(user_pk, path, info):
+    db, cursor = x.db()
+    try:
+        # Skipped if the user uploaded another avatar while this one was processing
+        cursor.execute(
+            "UPDATE users SET user_avatar_variants = %s WHERE user_pk = %s AND user_avatar_path = %s",
+            (info["variants"], user_pk, path),
+        )
+        if cursor.rowcount == 1:
+            bump_commented_posts(cursor, user_pk)
+        db.commit()
+    finally:
+        cursor.close()
+        db.close()
+    identity_cache.delete(user_pk)
+
+
 @app.post("/api/delete-account")
 def delete_account():
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
         db, cursor = x.db()
+        # Keep the denormalized counters on other users' posts in step with the rows removed below
+        cursor.execute(
+            """
+            UPDATE posts p
+            JOIN (SELECT comment_post_fk, COUNT(*) AS total FROM comments WHERE comment_user_fk = %s GROUP BY comment_post_fk) c
+              ON c.comment_post_fk = p.post_pk
+            SET p.post_total_comments = p.post_total_comments - LEAST(p.post_total_comments, c.total), p.post_version = p.post_version + 1
+            """,
+            (user["user_pk"],),
+        )
+        cursor.execute(
+            """
+            UPDATE posts p
+            JOIN post_likes l ON l.like_post_fk = p.post_pk AND l.like_user_fk = %s
+            SET p.post_total_likes = p.post_total_likes - LEAST(p.post_total_likes, 1)
+            """,
+            (user["user_pk"],),
+        )
+        cursor.execute(
+            """
+            UPDATE users u
+            JOIN follows f ON f.follow_following_fk = u.user_pk AND f.follow_follower_fk = %s
+            SET u.user_total_followers = u.user_total_followers - LEAST(u.user_total_followers, 1)
+            """,
+            (user["user_pk"],),
+        )
+        cursor.execute(
+            """
+            SELECT u.user_pk FROM users u
+            JOIN follows f ON f.follow_following_fk = u.user_pk AND f.follow_follower_fk = %s
+            WHERE u.user_total_followers = %s
+            """,
+            (user["user_pk"], x.FANOUT_MAX_FOLLOWERS),
+        )
+        dropped_to_fanout = [row["user_pk"] for row in cursor.fetchall()]
+        cursor.execute(
+            """
+            UPDATE uploads u
+            JOIN (
+                SELECT post_image_path AS path, COUNT(*) AS total FROM posts WHERE post_user_fk = %s AND post_image_path != '' GROUP BY post_image_path
+                UNION ALL
+                SELECT user_avatar_path, 1 FROM users WHERE user_pk = %s
+            ) r ON r.path = u.upload_path
+            SET u.upload_refs = u.upload_refs - LEAST(u.upload_refs, r.total), u.upload_updated_at = %s
+            """,
+            (user["user_pk"], user["user_pk"], int(time.time())),
+        )
         cursor.execute("DELETE FROM comments WHERE comment_user_fk = %s", (user["user_pk"],))
         cursor.execute("DELETE FROM post_likes WHERE like_user_fk = %s", (user["user_pk"],))
+        cursor.execute("DELETE FROM timelines WHERE timeline_user_fk = %s", (user["user_pk"],))
+        cursor.execute("DELETE FROM suggestions WHERE suggestion_user_fk = %s OR suggestion_target_fk = %s", (user["user_pk"], user["user_pk"]))
         cursor.execute("DELETE FROM follows WHERE follow_follower_fk = %s OR follow_following_fk = %s", (user["user_pk"], user["user_pk"]))
         cursor.execute("DELETE FROM posts WHERE post_user_fk = %s", (user["user_pk"],))
         cursor.execute("DELETE FROM users WHERE user_pk = %s", (user["user_pk"],))
         db.commit()
+        forget_user(user["user_pk"])
+        typeahead_index.remove(user["user_pk"])
+        bump_search_version()
+        for author_pk in dropped_to_fanout:
+            x.run_in_background(backfill_followers, author_pk)
         session.clear()
         return jsonify({"status": "ok", "redirect": url_for("index")})
     except Exception as ex:
@@ -707,34 +1486,194 @@ def delete_account():
 ##############################
 # SEARCH
 ##############################
+def search_users(cursor, term, after=None):
+    """
+    Relevance-ranked user search on the ft_users_names FULLTEXT index.
+    Terms with words below FULLTEXT_MIN_TOKEN fall back to index-friendly prefix matching.
+    """
+    words, short = x.fulltext_terms(term)
+    if short:
+        prefix = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        score_sql, score_params = "CAST(0 AS DECIMAL(12,6))", ()
+        where_sql, where_params = "(user_username LIKE %s OR user_first_name LIKE %s OR user_last_name LIKE %s)", (prefix, prefix, prefix)
+    else:
+        match_sql = "MATCH(user_username, user_first_name, user_last_name) AGAINST (%s IN NATURAL LANGUAGE MODE)"
+        score_sql, score_params = f"CAST({match_sql} AS DECIMAL(12,6))", (" ".join(words),)
+        where_sql, where_params = match_sql, score_params
+    keyset, keyset_params = "", ()
+    if after:
+        keyset = "WHERE score < CAST(%s AS DECIMAL(12,6)) OR (score = CAST(%s AS DECIMAL(12,6)) AND user_pk > %s)"
+        keyset_params = (after[0], after[0], after[1])
+    cursor.execute(
+        f"""
+        SELECT * FROM (
+            SELECT user_pk, user_username, user_first_name, user_last_name, user_avatar_path, {score_sql} AS score
+            FROM users
+            WHERE {where_sql} AND user_blocked_at = 0
+        ) ranked
+        {keyset}
+        ORDER BY score DESC, user_pk
+        LIMIT %s
+        """,
+        (*score_params, *where_params, *keyset_params, x.SEARCH_PAGE_SIZE + 1),
+    )
+    return paginate_search(cursor.fetchall(), "user_pk")
+
+
+def search_posts(cursor, term, after=None):
+    """
+    Relevance-ranked post search on the ft_posts_message FULLTEXT index.
+    Short words are matched as prefixes in boolean mode instead of scanning with LIKE '%term%'.
+    Scores are rounded to DECIMAL(12,6) so the cursor compares exactly against the value the page was cut at.
+    """
+    words, short = x.fulltext_terms(term)
+    if short:
+        match_sql, query = "MATCH(p.post_message) AGAINST (%s IN BOOLEAN MODE)", " ".join(f"+{word}*" for word in words)
+    else:
+        match_sql, query = "MATCH(p.post_message) AGAINST (%s IN NATURAL LANGUAGE MODE)", " ".join(words)
+    keyset, keyset_params = "", ()
+    if after:
+        keyset = "WHERE score < CAST(%s AS DECIMAL(12,6)) OR (score = CAST(%s AS DECIMAL(12,6)) AND post_pk > %s)"
+        keyset_params = (after[0], after[0], after[1])
+    cursor.execute(
+        f"""
+        SELECT * FROM (
+            SELECT p.post_pk, p.post_message, {LIKE_TOTAL_SQL} AS post_total_likes, p.post_total_comments, u.user_username, u.user_first_name, u.user_avatar_path,
+                CAST({match_sql} AS DECIMAL(12,6)) AS score
+            FROM posts p JOIN users u ON u.user_pk = p.post_user_fk
+            WHERE {match_sql} AND p.post_blocked_at = 0
+        ) ranked
+        {keyset}
+        ORDER BY score DESC, post_pk
+        LIMIT %s
+        """,
+        (query, query, *keyset_params, x.SEARCH_PAGE_SIZE + 1),
+    )
+    return paginate_search(cursor.fetchall(), "post_pk")
+
+
+def paginate_search(rows, pk_column):
+    next_cursor = ""
+    if len(rows) > x.SEARCH_PAGE_SIZE:
+        rows = rows[: x.SEARCH_PAGE_SIZE]
+        next_cursor = x.encode_search_cursor(rows[-1]["score"], rows[-1][pk_column])
+    for row in rows:
+        row["score"] = float(row["score"])
+    return rows, next_cursor
+
+
+##############################
+# TYPEAHEAD
+##############################
+typeahead_index = x.PrefixIndex()
+typeahead_build_lock = threading.Lock()
+
+
+def typeahead_record(row):
+    return {key: row.get(key, "") for key in ("user_pk", "user_username", "user_first_name", "user_last_name", "user_avatar_path")}
+
+
+def build_typeahead():
+    """
+    Loads every active user into the in-process prefix index.
+    Started by start_background_jobs() (or the first typeahead request) and repeated every
+    TYPEAHEAD_REBUILD_INTERVAL to pick up changes made by other workers. Overlapping calls return at once.
+    """
+    if not typeahead_build_lock.acquire(blocking=False):
+        return
+    try:
+        db, cursor = x.db()
+        try:
+            cursor.execute("SELECT user_pk, user_username, user_first_name, user_last_name, user_avatar_path FROM users WHERE user_blocked_at = 0")
+            typeahead_index.rebuild(cursor.fetchall())
+        finally:
+            cursor.close()
+            db.close()
+    finally:
+        typeahead_build_lock.release()
+
+
+def search_typeahead_db(cursor, q, exclude_pk):
+    """
+    Prefix lookup in the database, used until the in-memory index has been built.
+    """
+    prefix = q.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    cursor.execute(
+        """
+        SELECT user_pk, user_username, user_first_name, user_last_name, user_avatar_path FROM users
+        WHERE (user_username LIKE %s OR user_first_name LIKE %s OR user_last_name LIKE %s) AND user_blocked_at = 0 AND user_pk != %s
+        ORDER BY user_username
+        LIMIT %s
+        """,
+        (prefix, prefix, prefix, exclude_pk, x.TYPEAHEAD_LIMIT),
+    )
+    return [typeahead_record(row) for row in cursor.fetchall()]
+
+
+@app.get("/api/typeahead")
+def api_typeahead():
+    user = current_user()
+    if not user or user.get("user_blocked_at", 0):
+        return jsonify({"status": "error", "message": "Login required"}), 401
+    try:
+        q = request.args.get("q", "")[: x.USERNAME_MAX + x.NAME_MAX]
+        if not q.strip():
+            return jsonify({"status": "ok", "users": []})
+        if typeahead_index.ready:
+            users = typeahead_index.search(q, exclude=user["user_pk"])
+        else:
+            x.run_in_background(build_typeahead)
+            db, cursor = x.db()
+            users = search_typeahead_db(cursor, q, user["user_pk"])
+        return jsonify({"status": "ok", "users": users})
+    except Exception as ex:
+        msg = ex.args[0] if ex.args else "System under maintenance"
+        status = ex.args[1] if len(ex.args) > 1 else 500
+        return jsonify({"status": "error", "message": msg}), status
+    finally:
+        if "cursor" in locals():
+            cursor.close()
+        if "db" in locals():
+            db.close()
+
+
+# The version is per process: a change made through another worker is only seen here once the entry's
+# SEARCH_CACHE_TTL runs out. That staleness is accepted for search; browsers are told not to add their own on top.
+search_cache = x.LRUCache(x.SEARCH_CACHE_MAX_ITEMS, ttl=x.SEARCH_CACHE_TTL)
+search_version = 0  # bumped whenever searchable posts or users change in this process
+
+
+def bump_search_version():
+    global search_version
+    search_version += 1
+
+
+@app.get("/api/search")
 @app.post("/api/search")
 def api_search():
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_blocked_at", 0):
         return jsonify({"status": "error", "message": "Login required"}), 401
     try:
-        search_for = request.form.get("search_for", "").strip()
-        if len(search_for) < 2:
+        search_for = " ".join(request.values.get("search_for", "").split()).lower()
+        if len(search_for) < 2 or not x.fulltext_terms(search_for)[0]:
             raise Exception(dictionary.invalid_search[lan], 400)
-        like_term = f"%{search_for}%"
-        db, cursor = x.db()
-        cursor.execute(
-            "SELECT user_pk, user_username, user_first_name, user_last_name, user_avatar_path FROM users WHERE (user_username LIKE %s OR user_first_name LIKE %s OR user_last_name LIKE %s) AND user_blocked_at = 0 LIMIT 10",
-            (like_term, like_term, like_term),
-        )
-        users = cursor.fetchall()
-        cursor.execute(
-            """
-            SELECT p.post_pk, p.post_message, u.user_username, u.user_first_name, u.user_avatar_path
-            FROM posts p JOIN users u ON u.user_pk = p.post_user_fk
-            WHERE p.post_message LIKE %s AND p.post_blocked_at = 0
-            LIMIT 10
-            """,
-            (like_term,),
-        )
-        posts = cursor.fetchall()
-        return jsonify({"status": "ok", "users": users, "posts": posts})
+        kind = request.values.get("type", "all")
+        users_after = x.validate_search_cursor(request.values["users_after"], "cursor", lan) if request.values.get("users_after") else None
+        posts_after = x.validate_search_cursor(request.values["posts_after"], "cursor", lan) if request.values.get("posts_after") else None
+        key = (search_version, search_for, kind, users_after, posts_after)
+        result = search_cache.get(key)
+        if result is None:
+            db, cursor = x.db()
+            users, next_users = search_users(cursor, search_for, users_after) if kind in ("all", "users") else ([], "")
+            posts, next_posts = search_posts(cursor, search_for, posts_after) if kind in ("all", "posts") else ([], "")
+            result = {"status": "ok", "users": users, "posts": posts, "next_users": next_users, "next_posts": next_posts}
+            search_cache.set(key, result)
+        response = jsonify(result)
+        if request.method == "GET":
+            response.headers["Cache-Control"] = "private, no-cache"
+        return response
     except Exception as ex:
         msg = ex.args[0] if ex.args else "System under maintenance"
         status = ex.args[1] if len(ex.args) > 1 else 500
@@ -751,7 +1690,7 @@ def api_search():
 ##############################
 @app.get("/admin")
 def admin_home():
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_role") != "admin":
         return redirect(url_for("view_login"))
     lan = set_language()
@@ -759,7 +1698,12 @@ def admin_home():
         db, cursor = x.db()
         cursor.execute("SELECT * FROM users ORDER BY user_created_at DESC")
         users = cursor.fetchall()
-        cursor.execute("SELECT * FROM posts ORDER BY post_created_at DESC LIMIT 50")
+        cursor.execute(
+            f"""
+            SELECT p.post_pk, p.post_user_fk, p.post_message, {LIKE_TOTAL_SQL} AS post_total_likes, p.post_total_comments, p.post_blocked_at, p.post_created_at
+            FROM posts p ORDER BY p.post_created_at DESC LIMIT 50
+            """
+        )
         posts = cursor.fetchall()
         return render_template("admin.html", users=users, posts=posts, lan=lan)
     except Exception as ex:
@@ -772,10 +1716,18 @@ def admin_home():
             db.close()
 
 
+@app.get("/admin/email-stats")
+def email_stats():
+    user = current_user()
+    if not user or user.get("user_role") != "admin":
+        return jsonify({"status": "error", "message": "Admin only"}), 403
+    return jsonify({"status": "ok", "email": x.email_queue.stats()})
+
+
 @app.post("/admin/block-user")
 def block_user():
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_role") != "admin":
         return jsonify({"status": "error", "message": "Admin only"}), 403
     try:
@@ -783,14 +1735,25 @@ def block_user():
         action = request.form.get("action", "block")
         blocked_at = int(time.time()) if action == "block" else 0
         db, cursor = x.db()
-        cursor.execute("UPDATE users SET user_blocked_at = %s WHERE user_pk = %s", (blocked_at, target))
-        db.commit()
-        cursor.execute("SELECT user_email FROM users WHERE user_pk = %s", (target,))
+        # A block also bumps user_version so the user's existing sessions end
+        cursor.execute(
+            "UPDATE users SET user_blocked_at = %s, user_version = user_version + (%s > 0) WHERE user_pk = %s",
+            (blocked_at, blocked_at, target),
+        )
+        cursor.execute("SELECT user_pk, user_email, user_username, user_first_name, user_last_name, user_avatar_path FROM users WHERE user_pk = %s", (target,))
         row = cursor.fetchone()
         if row:
             status_text = "blocked" if action == "block" else "unblocked"
             body = render_template("_email_block_notice.html", status=status_text)
-            x.send_email(row["user_email"], "Account status updated", body)
+            x.add_to_outbox(cursor, "email", {"to": row["user_email"], "subject": "Account status updated", "template": body})
+        db.commit()
+        x.run_in_background(x.relay_outbox)
+        identity_cache.delete(target)
+        bump_search_version()
+        if row and blocked_at:
+            typeahead_index.remove(target)
+        elif row:
+            typeahead_index.add(typeahead_record(row))
         return jsonify({"status": "ok", "blocked_at": blocked_at})
     except Exception as ex:
         if "db" in locals():
@@ -808,7 +1771,7 @@ def block_user():
 @app.post("/admin/block-post")
 def block_post():
     lan = set_language()
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_role") != "admin":
         return jsonify({"status": "error", "message": "Admin only"}), 403
     try:
@@ -816,8 +1779,7 @@ def block_post():
         action = request.form.get("action", "block")
         blocked_at = int(time.time()) if action == "block" else 0
         db, cursor = x.db()
-        cursor.execute("UPDATE posts SET post_blocked_at = %s WHERE post_pk = %s", (blocked_at, post_pk))
-        db.commit()
+        cursor.execute("UPDATE posts SET post_blocked_at = %s, post_version = post_version + 1 WHERE post_pk = %s", (blocked_at, post_pk))
         cursor.execute(
             "SELECT u.user_email FROM posts p JOIN users u ON u.user_pk = p.post_user_fk WHERE p.post_pk = %s",
             (post_pk,),
@@ -826,7 +1788,10 @@ def block_post():
         if row:
             status_text = "blocked" if action == "block" else "unblocked"
             body = render_template("_email_block_notice.html", status=status_text)
-            x.send_email(row["user_email"], "Post status updated", body)
+            x.add_to_outbox(cursor, "email", {"to": row["user_email"], "subject": "Post status updated", "template": body})
+        db.commit()
+        x.run_in_background(x.relay_outbox)
+        bump_search_version()
         return jsonify({"status": "ok", "blocked_at": blocked_at})
     except Exception as ex:
         if "db" in locals():
@@ -843,7 +1808,7 @@ def block_post():
 
 @app.get("/admin/sync-languages")
 def sync_languages():
-    user = session.get("user")
+    user = current_user()
     if not user or user.get("user_role") != "admin":
         return jsonify({"status": "error", "message": "Admin only"}), 403
     try:
@@ -851,28 +1816,95 @@ def sync_languages():
         if not sheet_key:
             raise Exception("Missing GOOGLE_SHEET_KEY", 400)
         url = f"https://docs.google.com/spreadsheets/d/{sheet_key}/export?format=csv&id={sheet_key}"
-        res = requests.get(url=url)
-        csv_text = res.content.decode("utf-8")
-        csv_file = io.StringIO(csv_text)
-        reader = csv.DictReader(csv_file)
-        data = {}
-        for row in reader:
-            data[row["key"]] = {
-                "english": row.get("english", ""),
-                "danish": row.get("danish", ""),
-                "spanish": row.get("spanish", ""),
-            }
-        with open("dictionary.json", "w", encoding="utf-8") as f:
-            f.write(json.dumps(data, ensure_ascii=False, indent=2))
-        return jsonify({"status": "ok", "message": "Dictionary synced"})
+        changed = x.sync_dictionary(url)
+        return jsonify({"status": "ok", "message": "Dictionary synced", "changed": changed})
     except Exception as ex:
         msg = ex.args[0] if ex.args else "System under maintenance"
         status = ex.args[1] if len(ex.args) > 1 else 500
         return jsonify({"status": "error", "message": msg}), status
 
 
+##############################
+# MEDIA
+##############################
+@app.get("/media/<path:filename>")
+def media(filename):
+    """
+    Serves uploads with strong ETags and Range/206 support (send_file with conditional=True).
+    Content-hashed names never change, so they are cached as immutable. With MEDIA_OFFLOAD set,
+    only headers are produced here and the front proxy streams the bytes.
+    """
+    path = safe_join(x.UPLOAD_ROOT, filename)
+    if not path or not os.path.isfile(path):
+        return "Not found", 404
+    etag = x.content_hash_etag(filename)
+    max_age = x.IMMUTABLE_MAX_AGE if etag else x.MEDIA_MAX_AGE
+    if x.MEDIA_OFFLOAD == "accel":
+        response = make_response("")
+        response.headers["X-Accel-Redirect"] = x.MEDIA_ACCEL_PREFIX + filename
+        response.headers["Content-Type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        response.set_etag(etag or f"{os.path.getmtime(path):.0f}-{os.path.getsize(path)}")
+    else:
+        response = send_file(path, conditional=True, etag=etag or True, max_age=max_age)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if etag:
+        response.cache_control.immutable = True
+    return response
+
+
+##############################
+# ASSETS
+##############################
+@app.get("/assets/<path:filename>")
+def assets(filename):
+    """
+    Serves fingerprinted assets built by x.build_assets, picking a precompressed copy the client accepts.
+    """
+    path = safe_join(x.ASSET_BUILD_FOLDER, filename)
+    if not path or not os.path.isfile(path):
+        return "Not found", 404
+    mimetype = mimetypes.guess_type(path)[0]
+    encoding = next((enc for enc in ("br", "gzip") if request.accept_encodings[enc] and os.path.isfile(path + (".br" if enc == "br" else ".gz"))), None)
+    if encoding:
+        response = send_file(path + (".br" if encoding == "br" else ".gz"), mimetype=mimetype, conditional=True, etag=f"{filename}-{encoding}", max_age=x.IMMUTABLE_MAX_AGE)
+        response.headers["Content-Encoding"] = encoding
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=filename, max_age=x.IMMUTABLE_MAX_AGE)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Minify, fingerprint and precompress static assets."""
+    for name, hashed in x.build_assets().items():
+        print(f"{name} -> build/{hashed}")
+
+
 ##############################
 # MAIN
 ##############################
+def start_background_jobs():
+    """
+    Starts the periodic maintenance jobs. Called by the server entry point, not on import,
+    so the CLI, tests and tooling can import the app without opening DB connections.
+    """
+    x.schedule_periodic("sweep_sessions", x.SESSION_SWEEP_INTERVAL, app.session_interface.sweep)
+    x.schedule_periodic("relay_outbox", x.OUTBOX_RELAY_INTERVAL, x.relay_outbox)
+    x.schedule_periodic("collect_uploads", x.UPLOAD_GC_INTERVAL, x.collect_uploads)
+    x.schedule_periodic("fold_like_shards", x.LIKE_SHARD_FOLD_INTERVAL, fold_like_shards)
+    x.run_in_background(build_typeahead)
+    x.schedule_periodic("build_typeahead", x.TYPEAHEAD_REBUILD_INTERVAL, build_typeahead)
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080, debug=True)
+    debug = True
+    # With debug on, the reloader re-runs this file in a child process that serves the requests;
+    # only that child (WERKZEUG_RUN_MAIN) starts the jobs, so the watching parent does not run them twice
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_jobs()
+    # Language and user state are request scoped, so one process can serve requests on many threads
+    app.run(host="0.0.0.0", port=8080, debug=debug, threaded=True)
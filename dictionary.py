@@ -177,7 +177,11 @@ first_name = {"english": "First name", "danish": "Fornavn", "spanish": "Nombre"}
 last_name = {"english": "Last name", "danish": "Efternavn", "spanish": "Apellido"}
 create_post = {"english": "Share a vinyl vibe", "danish": "Del en vinyl vibe", "spanish": "Comparte una vibra"}
 comment_placeholder = {"english": "Write a comment", "danish": "Skriv en kommentar", "spanish": "Escribe un comentario"}
+load_more_comments = {"english": "Load more comments", "danish": "Vis flere kommentarer", "spanish": "Ver más comentarios"}
 search_placeholder = {"english": "Search posts or people", "danish": "Søg opslag eller brugere", "spanish": "Busca publicaciones o personas"}
+more_results = {"english": "More results", "danish": "Flere resultater", "spanish": "Más resultados"}
+comments_label = {"english": "comments", "danish": "kommentarer", "spanish": "comentarios"}
+likes_label = {"english": "likes", "danish": "likes", "spanish": "me gusta"}
 follow = {"english": "Follow", "danish": "Følg", "spanish": "Seguir"}
 unfollow = {"english": "Unfollow", "danish": "Fjern følger", "spanish": "Dejar de seguir"}
 like = {"english": "Like", "danish": "Synes om", "spanish": "Me gusta"}
@@ -185,5 +189,7 @@ unlike = {"english": "Unlike", "danish": "Fjern like", "spanish": "Quitar me gus
 logout = {"english": "Logout", "danish": "Log ud", "spanish": "Salir"}
 delete_account = {"english": "Delete account", "danish": "Slet konto", "spanish": "Eliminar cuenta"}
 home_title = {"english": "Latest spins", "danish": "Seneste spins", "spanish": "Ultimos lanzamientos"}
+feed_latest = {"english": "Latest", "danish": "Seneste", "spanish": "Recientes"}
+feed_following = {"english": "Following", "danish": "Følger", "spanish": "Siguiendo"}
 admin_panel = {"english": "Admin", "danish": "Admin", "spanish": "Admin"}
 profile_nav = {"english": "Profile", "danish": "Profil", "spanish": "Perfil"}
@@ -11,6 +11,7 @@ CREATE TABLE IF NOT EXISTS users (
   user_first_name VARCHAR(40) NOT NULL,
   user_last_name VARCHAR(40) NOT NULL,
   user_avatar_path VARCHAR(255) NOT NULL,
+  user_avatar_variants VARCHAR(64) NOT NULL DEFAULT '',
   user_bio VARCHAR(160) NOT NULL DEFAULT '',
   user_verification_key CHAR(32) NOT NULL DEFAULT '',
   user_verified_at BIGINT UNSIGNED NOT NULL DEFAULT 0,
@@ -18,10 +19,14 @@ CREATE TABLE IF NOT EXISTS users (
   user_reset_expires BIGINT UNSIGNED NOT NULL DEFAULT 0,
   user_role ENUM('user','admin') NOT NULL DEFAULT 'user',
   user_blocked_at BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  user_total_followers BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  user_version INT UNSIGNED NOT NULL DEFAULT 0,
   user_created_at BIGINT UNSIGNED NOT NULL,
   PRIMARY KEY (user_pk),
   UNIQUE KEY uq_users_email (user_email),
-  UNIQUE KEY uq_users_username (user_username)
+  UNIQUE KEY uq_users_username (user_username),
+  KEY idx_users_followers (user_total_followers),
+  FULLTEXT KEY ft_users_names (user_username, user_first_name, user_last_name)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 CREATE TABLE IF NOT EXISTS posts (
@@ -29,11 +34,19 @@ CREATE TABLE IF NOT EXISTS posts (
   post_user_fk CHAR(32) NOT NULL,
   post_message VARCHAR(280) NOT NULL,
   post_total_likes BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  post_total_comments BIGINT UNSIGNED NOT NULL DEFAULT 0,
   post_image_path VARCHAR(255) NOT NULL DEFAULT '',
+  post_image_width INT UNSIGNED NOT NULL DEFAULT 0,
+  post_image_height INT UNSIGNED NOT NULL DEFAULT 0,
+  post_image_variants VARCHAR(64) NOT NULL DEFAULT '',
   post_blocked_at BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  post_version INT UNSIGNED NOT NULL DEFAULT 0,
   post_created_at BIGINT UNSIGNED NOT NULL,
   PRIMARY KEY (post_pk),
   KEY fk_posts_users (post_user_fk),
+  KEY idx_posts_feed (post_blocked_at, post_created_at, post_pk),
+  KEY idx_posts_author (post_user_fk, post_created_at, post_pk),
+  FULLTEXT KEY ft_posts_message (post_message),
   CONSTRAINT fk_posts_users FOREIGN KEY (post_user_fk) REFERENCES users (user_pk) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
@@ -58,6 +71,7 @@ CREATE TABLE IF NOT EXISTS comments (
   comment_created_at BIGINT UNSIGNED NOT NULL,
   PRIMARY KEY (comment_pk),
   KEY fk_comment_post (comment_post_fk),
+  KEY idx_comments_post (comment_post_fk, comment_created_at, comment_pk),
   KEY fk_comment_user (comment_user_fk),
   CONSTRAINT fk_comment_post FOREIGN KEY (comment_post_fk) REFERENCES posts (post_pk) ON DELETE CASCADE,
   CONSTRAINT fk_comment_user FOREIGN KEY (comment_user_fk) REFERENCES users (user_pk) ON DELETE CASCADE
@@ -76,6 +90,102 @@ CREATE TABLE IF NOT EXISTS follows (
   CONSTRAINT fk_follow_following FOREIGN KEY (follow_following_fk) REFERENCES users (user_pk) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
+-- Sharded like counters for hot posts, folded back into posts.post_total_likes periodically
+CREATE TABLE IF NOT EXISTS post_like_shards (
+  shard_post_fk CHAR(32) NOT NULL,
+  shard_slot TINYINT UNSIGNED NOT NULL,
+  shard_delta BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (shard_post_fk, shard_slot),
+  CONSTRAINT fk_shard_post FOREIGN KEY (shard_post_fk) REFERENCES posts (post_pk) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Materialized "Following" feed: one row per (reader, post), filled by fan-out on write
+CREATE TABLE IF NOT EXISTS timelines (
+  timeline_user_fk CHAR(32) NOT NULL,
+  timeline_post_fk CHAR(32) NOT NULL,
+  timeline_author_fk CHAR(32) NOT NULL,
+  timeline_post_created_at BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (timeline_user_fk, timeline_post_created_at, timeline_post_fk),
+  UNIQUE KEY uq_timeline (timeline_user_fk, timeline_post_fk),
+  KEY idx_timeline_author (timeline_user_fk, timeline_author_fk),
+  KEY fk_timeline_post (timeline_post_fk),
+  CONSTRAINT fk_timeline_user FOREIGN KEY (timeline_user_fk) REFERENCES users (user_pk) ON DELETE CASCADE,
+  CONSTRAINT fk_timeline_post FOREIGN KEY (timeline_post_fk) REFERENCES posts (post_pk) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Precomputed "who to follow" candidates, refreshed in the background
+CREATE TABLE IF NOT EXISTS suggestions (
+  suggestion_user_fk CHAR(32) NOT NULL,
+  suggestion_target_fk CHAR(32) NOT NULL,
+  suggestion_score BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  suggestion_created_at BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (suggestion_user_fk, suggestion_target_fk),
+  KEY idx_suggestions_rank (suggestion_user_fk, suggestion_score),
+  KEY fk_suggestion_target (suggestion_target_fk),
+  CONSTRAINT fk_suggestion_user FOREIGN KEY (suggestion_user_fk) REFERENCES users (user_pk) ON DELETE CASCADE,
+  CONSTRAINT fk_suggestion_target FOREIGN KEY (suggestion_target_fk) REFERENCES users (user_pk) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Server-side sessions; the cookie only holds session_id. Expired rows are swept by the app
+CREATE TABLE IF NOT EXISTS sessions (
+  session_id VARCHAR(64) NOT NULL,
+  session_data MEDIUMTEXT NOT NULL,
+  session_expires_at BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (session_id),
+  KEY idx_sessions_expires (session_expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Reference counts for content-addressed files under static/uploads; rows at 0 are reclaimed by x.collect_uploads
+CREATE TABLE IF NOT EXISTS uploads (
+  upload_path VARCHAR(255) NOT NULL,
+  upload_refs INT UNSIGNED NOT NULL DEFAULT 0,
+  upload_updated_at BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (upload_path),
+  KEY idx_uploads_unreferenced (upload_refs, upload_updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Side effects (emails) written in the same transaction as the change that causes them; drained by x.relay_outbox
+CREATE TABLE IF NOT EXISTS outbox (
+  outbox_pk BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  outbox_kind VARCHAR(30) NOT NULL,
+  outbox_payload MEDIUMTEXT NOT NULL,
+  outbox_attempts INT UNSIGNED NOT NULL DEFAULT 0,
+  outbox_available_at BIGINT UNSIGNED NOT NULL,
+  outbox_failed_at BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  outbox_created_at BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (outbox_pk),
+  KEY idx_outbox_due (outbox_failed_at, outbox_available_at, outbox_pk)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Migrations for databases created before the columns/keys above existed
+CREATE INDEX IF NOT EXISTS idx_posts_feed ON posts (post_blocked_at, post_created_at, post_pk);
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS post_total_comments BIGINT UNSIGNED NOT NULL DEFAULT 0 AFTER post_total_likes;
+CREATE INDEX IF NOT EXISTS idx_posts_author ON posts (post_user_fk, post_created_at, post_pk);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS user_total_followers BIGINT UNSIGNED NOT NULL DEFAULT 0 AFTER user_blocked_at;
+CREATE INDEX IF NOT EXISTS idx_users_followers ON users (user_total_followers);
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS post_version INT UNSIGNED NOT NULL DEFAULT 0 AFTER post_blocked_at;
+CREATE INDEX IF NOT EXISTS idx_comments_post ON comments (comment_post_fk, comment_created_at, comment_pk);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS user_version INT UNSIGNED NOT NULL DEFAULT 0 AFTER user_total_followers;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS user_avatar_variants VARCHAR(64) NOT NULL DEFAULT '' AFTER user_avatar_path;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS post_image_width INT UNSIGNED NOT NULL DEFAULT 0 AFTER post_image_path;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS post_image_height INT UNSIGNED NOT NULL DEFAULT 0 AFTER post_image_width;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS post_image_variants VARCHAR(64) NOT NULL DEFAULT '' AFTER post_image_height;
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_users_names ON users (user_username, user_first_name, user_last_name);
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_posts_message ON posts (post_message);
+
+-- Recompute the denormalized counters (safe to re-run)
+UPDATE posts p SET
+  p.post_total_likes = (SELECT COUNT(*) FROM post_likes WHERE like_post_fk = p.post_pk),
+  p.post_total_comments = (SELECT COUNT(*) FROM comments WHERE comment_post_fk = p.post_pk);
+UPDATE users u SET u.user_total_followers = (SELECT COUNT(*) FROM follows WHERE follow_following_fk = u.user_pk);
+INSERT INTO uploads (upload_path, upload_refs, upload_updated_at)
+SELECT path, COUNT(*), UNIX_TIMESTAMP() FROM (
+  SELECT post_image_path AS path FROM posts WHERE post_image_path != '' AND post_image_path NOT LIKE 'http%'
+  UNION ALL
+  SELECT user_avatar_path FROM users WHERE user_avatar_path NOT LIKE 'http%'
+) refs GROUP BY path
+ON DUPLICATE KEY UPDATE upload_refs = VALUES(upload_refs);
+
 -- Seed admin user (password: admin123)
 INSERT INTO users (user_pk, user_email, user_password, user_username, user_first_name, user_last_name, user_avatar_path, user_bio, user_verification_key, user_verified_at, user_reset_key, user_reset_expires, user_role, user_blocked_at, user_created_at)
 VALUES ('0000000000000000000000000000admin', 'admin@vinylvibes.test', 'pbkdf2:sha256:1000000$c5tGOjitkyJ2E1ZC$072a4afb07396302d7b80cc4599f7c45ca3ae37997be69dca45cae97bfc3244d', 'admin', 'Admin', '', 'https://avatar.iran.liara.run/public/100', '', '', UNIX_TIMESTAMP(), '', 0, 'admin', 0, UNIX_TIMESTAMP())
@@ -67,6 +67,33 @@ function bindLikeButtons() {
   });
 }
 
+// Hent like-tal, "liked by me" og kommentar-tal for mange opslag i ét kald
+async function hydratePostStates(root = document) {
+  const buttons = [...root.querySelectorAll(".js-like[data-hydrate]")];
+  const postPks = [...new Set(buttons.map((btn) => btn.dataset.post))];
+  if (!postPks.length) return;
+  try {
+    const data = await fetchJson("/api/posts/state", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ post_pks: postPks }),
+    });
+    buttons.forEach((btn) => {
+      const state = data.posts[btn.dataset.post];
+      if (!state) return;
+      const count = btn.querySelector(".like-count");
+      if (count) count.textContent = state.likes;
+      const icon = btn.querySelector("i");
+      if (icon) icon.className = state.liked_by_me ? "fa-solid fa-heart" : "fa-regular fa-heart";
+      const comments = btn.parentElement.querySelector(".comment-count");
+      if (comments) comments.textContent = state.comments;
+      delete btn.dataset.hydrate;
+    });
+  } catch (err) {
+    console.error(err);
+  }
+}
+
 // Delete (post/comment)
 function bindDeleteButtons() {
   document.body.addEventListener("click", async (e) => {
@@ -124,36 +151,174 @@ function bindCommentForms() {
   });
 }
 
-// Search (submit only)
+// Search (submit + "flere resultater" via cursors)
+// Søgeresultater er brugerindhold og skal escapes før de sættes ind som HTML
+function escapeHtml(value) {
+  return String(value ?? "").replace(/[&<>"']/g, (c) => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" })[c]);
+}
+
+function searchUserRow(u) {
+  return `<div class="search-row"><strong>${escapeHtml(u.user_first_name)}</strong> @${escapeHtml(u.user_username)}</div>`;
+}
+
+function searchPostRow(p, commentsLabel) {
+  return `<div class="search-row">${escapeHtml(p.post_message)} <span class="muted">@${escapeHtml(p.user_username)}</span>
+    <button class="icon-btn js-like" data-post="${escapeHtml(p.post_pk)}" data-hydrate="1"><i class="fa-regular fa-heart"></i> <span class="like-count">${Number(p.post_total_likes)}</span></button>
+    <span class="muted"><span class="comment-count">${Number(p.post_total_comments)}</span> ${escapeHtml(commentsLabel)}</span></div>`;
+}
+
 function bindSearch() {
   const form = document.querySelector(".js-search");
-  if (!form || form.dataset.bound) return;
+  const results = document.querySelector("#search_results");
+  if (!form || !results || form.dataset.bound) return;
   form.dataset.bound = "1";
+  let cursors = {};
+
+  const render = (data, append) => {
+    const html = data.users.map(searchUserRow).join("") + data.posts.map((p) => searchPostRow(p, form.dataset.comments)).join("");
+    const more = results.querySelector(".js-search-more");
+    if (more) more.remove();
+    if (append) {
+      results.insertAdjacentHTML("beforeend", html);
+    } else {
+      results.innerHTML = html;
+    }
+    cursors = { users_after: data.next_users, posts_after: data.next_posts };
+    if (cursors.users_after || cursors.posts_after) {
+      const button = document.createElement("button");
+      button.className = "btn btn-secondary js-search-more";
+      button.type = "button";
+      button.textContent = form.dataset.more;
+      results.append(button);
+    }
+    hydratePostStates(results);
+  };
+
+  // GET så browseren kan genbruge svar på populære søgninger
+  const searchUrl = (fd) => {
+    const url = new URL(form.action, window.location.origin);
+    fd.forEach((value, key) => url.searchParams.set(key, value));
+    return url;
+  };
+
   form.addEventListener("submit", async (e) => {
     e.preventDefault();
+    try {
+      render(await fetchJson(searchUrl(new FormData(form))), false);
+    } catch (err) {
+      alert(err.message);
+    }
+  });
+
+  results.addEventListener("click", async (e) => {
+    if (!e.target.closest(".js-search-more")) return;
     const fd = new FormData(form);
+    fd.set("type", cursors.users_after && cursors.posts_after ? "all" : cursors.users_after ? "users" : "posts");
+    if (cursors.users_after) fd.set("users_after", cursors.users_after);
+    if (cursors.posts_after) fd.set("posts_after", cursors.posts_after);
     try {
-      const data = await fetchJson(form.action, { method: "POST", body: fd });
-      const results = document.querySelector("#search_results");
-      if (!results) return;
-      const users = data.users
-        .map((u) => `<div class="search-row"><strong>${u.user_first_name}</strong> @${u.user_username}</div>`)
-        .join("");
-      const posts = data.posts
-        .map((p) => `<div class="search-row">${p.post_message} <span class="muted">@${p.user_username}</span></div>`)
-        .join("");
-      results.innerHTML = users + posts;
+      render(await fetchJson(searchUrl(fd)), true);
     } catch (err) {
       alert(err.message);
     }
   });
 }
 
+// Typeahead: forslag til personer mens man skriver (debounced)
+function bindTypeahead() {
+  const input = document.querySelector("input[data-typeahead]");
+  const results = document.querySelector("#typeahead_results");
+  if (!input || !results) return;
+  let timer = null;
+  let controller = null;
+  input.addEventListener("input", () => {
+    clearTimeout(timer);
+    timer = setTimeout(async () => {
+      const q = input.value.trim();
+      if (controller) controller.abort();
+      if (!q) {
+        results.innerHTML = "";
+        return;
+      }
+      controller = new AbortController();
+      try {
+        const url = new URL(input.dataset.typeahead, window.location.origin);
+        url.searchParams.set("q", q);
+        const data = await fetchJson(url, { signal: controller.signal });
+        results.innerHTML = data.users.map(searchUserRow).join("");
+      } catch (err) {
+        if (err.name !== "AbortError") console.error(err);
+      }
+    }, 150);
+  });
+}
+
+// Hent ældre kommentarer til et opslag
+function bindMoreComments() {
+  document.body.addEventListener("click", async (e) => {
+    const btn = e.target.closest(".js-more-comments");
+    if (!btn || btn.disabled) return;
+    e.preventDefault();
+    btn.disabled = true;
+    try {
+      const url = new URL(btn.dataset.url, window.location.origin);
+      url.searchParams.set("before", btn.dataset.before);
+      const data = await fetchJson(url);
+      const target = document.querySelector(btn.dataset.target);
+      if (target) target.insertAdjacentHTML("beforeend", data.html);
+      if (data.next) {
+        btn.dataset.before = data.next;
+      } else {
+        btn.remove();
+      }
+    } catch (err) {
+      alert(err.message);
+    } finally {
+      btn.disabled = false;
+    }
+  });
+}
+
+// Uendelig scroll: hent næste side af feedet når bunden nærmer sig
+function bindInfiniteFeed() {
+  const feed = document.querySelector("#feed");
+  const sentinel = document.querySelector("#feed_sentinel");
+  if (!feed || !sentinel || !("IntersectionObserver" in window)) return;
+  let loading = false;
+  const observer = new IntersectionObserver(async (entries) => {
+    if (!entries.some((entry) => entry.isIntersecting) || loading) return;
+    const next = feed.dataset.next;
+    if (!next) {
+      observer.disconnect();
+      return;
+    }
+    loading = true;
+    try {
+      const url = new URL(feed.dataset.url, window.location.origin);
+      url.searchParams.set("after", next);
+      const data = await fetchJson(url);
+      feed.insertAdjacentHTML("beforeend", data.html);
+      feed.dataset.next = data.next;
+      bindAjaxForms();
+      if (!data.next) observer.disconnect();
+    } catch (err) {
+      observer.disconnect();
+      alert(err.message);
+    } finally {
+      loading = false;
+    }
+  }, { rootMargin: "600px 0px" });
+  observer.observe(sentinel);
+}
+
 document.addEventListener("DOMContentLoaded", () => {
   bindAjaxForms();
   bindCommentForms();
   bindLikeButtons();
   bindDeleteButtons();
   bindFollowButtons();
+  bindMoreComments();
   bindSearch();
+  bindTypeahead();
+  bindInfiniteFeed();
 });
@@ -0,0 +1,60 @@
+"""
+Lookups per second for x.lans(): the old read-the-file-per-call lookup against the in-memory table.
+Run from the repository root with `python tests/bench_translations.py`; results go to bench_output.txt.
+"""
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import dictionary  # noqa: E402
+import x  # noqa: E402
+
+KEYS = ("invalid_uuid", "invalid_search", "search_placeholder", "follow", "like", "more_results")
+LANGUAGES = ("english", "danish", "spanish")
+SECONDS = 2.0
+
+
+def file_lans(key, lan):
+    """The lookup before the translation table: dictionary.json is opened and parsed on every call."""
+    try:
+        with open(x.DICTIONARY_PATH, "r", encoding="utf-8") as file:
+            data = json.load(file)
+            return data.get(key, {}).get(lan, key)
+    except Exception:
+        pass
+    value = getattr(dictionary, key, {})
+    return value.get(lan, value.get("english", key))
+
+
+def lookups_per_second(lookup):
+    calls, started = 0, time.perf_counter()
+    while time.perf_counter() - started < SECONDS:
+        for key in KEYS:
+            for lan in LANGUAGES:
+                lookup(key, lan)
+        calls += len(KEYS) * len(LANGUAGES)
+    return calls / (time.perf_counter() - started)
+
+
+def main():
+    x.reload_translations(force=True)
+    before = lookups_per_second(file_lans)
+    after = lookups_per_second(x.lans)
+    lines = [
+        f"dictionary.json: {os.path.getsize(x.DICTIONARY_PATH) if os.path.exists(x.DICTIONARY_PATH) else 0} bytes",
+        f"read file per lookup: {before:>12,.0f} lookups/s",
+        f"in-memory table:      {after:>12,.0f} lookups/s",
+        f"speedup:              {after / before:>12,.1f}x",
+    ]
+    with open(os.path.join(ROOT, "bench_output.txt"), "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # dictionary.json, static/ and templates/ are resolved from the working directory
+
+import app as vinylvibes  # noqa: E402
+import x  # noqa: E402
+
+ADMIN_PK = "0000000000000000000000000000admin"
+
+
+@pytest.fixture
+def flask_app():
+    vinylvibes.app.config["TESTING"] = True
+    return vinylvibes.app
+
+
+@pytest.fixture
+def mysql():
+    """
+    A pooled connection to the database from DB_CONFIG; tests that need MariaDB are skipped without one.
+    """
+    try:
+        conn = x.get_pool().checkout()
+    except Exception as ex:
+        pytest.skip(f"MariaDB not reachable: {ex}")
+    yield conn
+    conn.close()
+
+
+def create_user(conn, user_pk):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO users (user_pk, user_email, user_password, user_username, user_first_name, user_last_name, user_avatar_path, user_created_at)
+        VALUES (%s, %s, '', %s, 'Test', 'User', '', UNIX_TIMESTAMP())
+        """,
+        (user_pk, f"{user_pk}@test.invalid", f"t{user_pk[:20]}"),
+    )
+    conn.commit()
+    cursor.close()
+
+
+def delete_users(conn, user_pks):
+    cursor = conn.cursor()
+    placeholders = ",".join(["%s"] * len(user_pks))
+    for sql in (
+        f"DELETE FROM post_likes WHERE like_user_fk IN ({placeholders})",
+        f"DELETE FROM post_like_shards WHERE shard_post_fk IN (SELECT post_pk FROM posts WHERE post_user_fk IN ({placeholders}))",
+        f"DELETE FROM posts WHERE post_user_fk IN ({placeholders})",
+        f"DELETE FROM users WHERE user_pk IN ({placeholders})",
+    ):
+        cursor.execute(sql, tuple(user_pks))
+    conn.commit()
+    cursor.close()
+
+
+def login_as(client, user_pk):
+    with client.session_transaction() as session:
+        session["user_pk"] = user_pk
+        session["user_version"] = 0
@@ -0,0 +1,78 @@
+import socketserver
+import threading
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server for tests. Collects (recipient, message) pairs and counts connections.
+    fail_next makes that many MAIL commands answer 451, a transient error the client should retry.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SmtpHandler)
+        self.messages = []
+        self.connections = 0
+        self.fail_next = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        sink = self.server
+        with sink.lock:
+            sink.connections += 1
+        self.reply("220 sink ready")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 sink")
+            elif verb == "MAIL":
+                with sink.lock:
+                    failing = sink.fail_next > 0
+                    sink.fail_next -= failing
+                self.reply("451 try again later" if failing else "250 ok")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip(" <>"))
+                self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 end with .")
+                body = []
+                for raw in iter(self.rfile.readline, b""):
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    body.append(raw.decode())
+                with sink.lock:
+                    sink.messages.extend((recipient, "".join(body)) for recipient in recipients)
+                recipients = []
+                self.reply("250 queued")
+            elif verb == "RSET":
+                recipients = []
+                self.reply("250 ok")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
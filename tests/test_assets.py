@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+from conftest import x
+
+
+@pytest.mark.parametrize("source, expected", [
+    ('const tick = "`";\nconst next = 1; // ` in a comment\n', 'const tick="`";\nconst next=1;\n'),
+    ("const re = /`+\\/\\/[/`]/g;\nconst half = a / b / c;\n", "const re=/`+\\/\\/[/`]/g;\nconst half=a/b/c;\n"),
+    ("const t = `  keep  ${ {a: 1}.a }  // kept\n  too`;\n/* ` */ go();\n", "const t=`  keep  ${{a:1}.a}  // kept\n  too`;\ngo();\n"),
+    ("if (ok)\n  return /x/.test(s)\nlet n = a - -b + +c\n", "if(ok)\nreturn/x/.test(s)\nlet n=a- -b+ +c\n"),
+])
+def test_minify_js_leaves_strings_templates_and_regexes_alone(source, expected):
+    assert x.minify_js(source) == expected
+
+
+@pytest.fixture
+def build_folder(tmp_path, monkeypatch):
+    folder = tmp_path / "build"
+    monkeypatch.setattr(x, "ASSET_BUILD_FOLDER", str(folder))
+    monkeypatch.setattr(x, "_asset_manifest", None)
+    return folder
+
+
+def test_build_assets_restores_missing_compressed_copies(build_folder):
+    manifest = x.build_assets()
+    copies = [build_folder / (manifest["app.js"] + ext) for ext in (".gz", ".br")]
+    for copy in copies:
+        copy.unlink()
+    assert x.build_assets() == manifest
+    assert all(copy.exists() for copy in copies)
+    assert not [name for name in os.listdir(build_folder) if name.startswith(".tmp-")]
+
+
+def test_load_assets_ignores_stale_manifest(build_folder):
+    build_folder.mkdir()
+    (build_folder / "app.old.js").write_text("old")
+    (build_folder / "manifest.json").write_text(json.dumps({"app.js": "app.old.js"}))
+    assert x.static_url("app.js") != "/assets/app.old.js"
+    assert x.static_url("app.js") == "/assets/" + json.loads((build_folder / "manifest.json").read_text())["app.js"]
+
+
+def test_write_bytes_atomic_removes_temp_file_on_failure(tmp_path, monkeypatch):
+    def fail(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(x.os, "replace", fail)
+    with pytest.raises(OSError):
+        x._write_bytes_atomic(str(tmp_path / "out.js"), b"data")
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,85 @@
+import http.server
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import x
+
+SHEET = 'key,english,danish\nhello,Hello,Hej\nquote,"Two\nlines",To linjer\n'
+ETAG = '"sheet-v1"'
+
+
+class SheetHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/login":
+            self.reply("text/html", b"<html><body>Sign in</body></html>")
+        elif self.path == "/empty":
+            self.reply("text/csv", b"key,english,danish\n")
+        elif self.path == "/stall":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.write(b"key,english,danish\n")
+            self.wfile.flush()
+            time.sleep(2)
+        elif self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.reply("text/csv; charset=utf-8", SHEET.encode())
+
+    def reply(self, content_type, body):
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def sheet_url(tmp_path, monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SheetHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(x, "DICTIONARY_PATH", str(tmp_path / "dictionary.json"))
+    monkeypatch.setattr(x, "DICTIONARY_META_PATH", str(tmp_path / "dictionary.meta.json"))
+    monkeypatch.setattr(x, "DICTIONARY_SYNC_TIMEOUT", (1, 0.5))
+    monkeypatch.setattr(x, "reload_translations", lambda force=False: None)
+    (tmp_path / "dictionary.json").write_text(json.dumps({"old": {"english": "Old"}}))
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_replaces_dictionary(sheet_url):
+    assert x.sync_dictionary(sheet_url + "/sheet") == ["hello", "old", "quote"]
+    data = json.loads(open(x.DICTIONARY_PATH).read())
+    assert data["quote"]["english"] == "Two\nlines"
+    assert data["hello"]["danish"] == "Hej"
+    assert json.loads(open(x.DICTIONARY_META_PATH).read())["etag"] == ETAG
+
+
+def test_sync_leaves_dictionary_untouched_on_not_modified(sheet_url):
+    with open(x.DICTIONARY_META_PATH, "w") as f:
+        json.dump({"etag": ETAG, "last_modified": ""}, f)
+    os.utime(x.DICTIONARY_PATH, (1_000_000_000, 1_000_000_000))
+    before = open(x.DICTIONARY_PATH).read()
+    assert x.sync_dictionary(sheet_url + "/sheet") == []
+    assert open(x.DICTIONARY_PATH).read() == before
+    assert os.stat(x.DICTIONARY_PATH).st_mtime == 1_000_000_000
+
+
+@pytest.mark.parametrize("path, status", [("/login", 502), ("/empty", 502), ("/stall", 504)])
+def test_sync_keeps_dictionary_on_bad_response(sheet_url, path, status):
+    with pytest.raises(Exception) as error:
+        x.sync_dictionary(sheet_url + path)
+    assert error.value.args[1] == status
+    assert json.loads(open(x.DICTIONARY_PATH).read()) == {"old": {"english": "Old"}}
@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import x
+from smtp_sink import SmtpSink
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    server = SmtpSink().start()
+    monkeypatch.setattr(x, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(x, "SMTP_PORT", server.port)
+    monkeypatch.setattr(x, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(x, "EMAIL_RETRY_BASE", 0.05)
+    monkeypatch.setenv("SMTP_USER", "noreply@vinylvibes.test")
+    monkeypatch.delenv("SMTP_PASSWORD", raising=False)  # the sink has no AUTH
+    yield server
+    server.stop()
+
+
+def test_delivers_over_reused_connections(sink):
+    emails = x.EmailQueue(workers=2)
+    for i in range(10):
+        emails.enqueue(f"user{i}@vinylvibes.test", "Hello", "<p>hi</p>")
+    assert emails.drain(timeout=5)
+    assert sorted(to for to, _ in sink.messages) == sorted(f"user{i}@vinylvibes.test" for i in range(10))
+    assert sink.connections <= 2
+    assert emails.stats()["sent"] == 10
+    emails.shutdown()
+
+
+def test_retries_after_transient_failure(sink):
+    sink.fail_next = 2
+    emails = x.EmailQueue(workers=1)
+    emails.enqueue("retry@vinylvibes.test", "Hello", "<p>hi</p>")
+    assert emails.drain(timeout=5)
+    stats = emails.stats()
+    assert [to for to, _ in sink.messages] == ["retry@vinylvibes.test"]
+    assert stats["retried"] == 2 and stats["sent"] == 1 and stats["failed"] == 0
+    emails.shutdown()
+
+
+def test_shutdown_drains_queue_and_rejects_new_mail(sink):
+    sink.fail_next = 1
+    emails = x.EmailQueue(workers=2)
+    for i in range(5):
+        emails.enqueue(f"late{i}@vinylvibes.test", "Bye", "<p>bye</p>")
+    assert emails.shutdown(timeout=5)
+    assert len(sink.messages) == 5
+    assert emails.stats()["depth"] == 0
+    with pytest.raises(Exception) as error:
+        emails.enqueue("after@vinylvibes.test", "Too late", "")
+    assert error.value.args[1] == 503
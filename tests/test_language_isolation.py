@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+import requests
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.serving import make_server
+
+from conftest import x
+
+EXPECTED = {
+    "english": "Invalid email",
+    "danish": "Ugyldig e-mail",
+    "spanish": "Correo electrónico inválido",
+}
+CLIENTS_PER_LANGUAGE = 4
+REQUESTS_PER_CLIENT = 25
+
+
+@pytest.fixture
+def threaded_server(flask_app, monkeypatch):
+    # Cookie sessions keep this test independent of MariaDB; the language lives in the session either way
+    monkeypatch.setattr(flask_app, "session_interface", SecureCookieSessionInterface())
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_language_does_not_leak_between_concurrent_requests(threaded_server):
+    mismatches = []
+
+    def worker(lan):
+        client = requests.Session()
+        client.get(f"{threaded_server}/lang/{lan}", allow_redirects=False, timeout=10)
+        for _ in range(REQUESTS_PER_CLIENT):
+            response = client.post(f"{threaded_server}/login", data={"email": "not-an-email"}, timeout=10)
+            if EXPECTED[lan] not in response.text:
+                mismatches.append(lan)
+
+    threads = [threading.Thread(target=worker, args=(lan,)) for lan in EXPECTED for _ in range(CLIENTS_PER_LANGUAGE)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert mismatches == []
+
+
+def test_validators_use_the_request_language(flask_app):
+    for lan, message in EXPECTED.items():
+        with flask_app.test_request_context("/", method="POST", data={"email": "nope"}):
+            x.set_language(lan)
+            with pytest.raises(Exception) as error:
+                x.validate_user_email()
+            assert error.value.args == (message, 400)
+    assert x.default_language == "english"
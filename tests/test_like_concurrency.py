@@ -0,0 +1,76 @@
+import threading
+import uuid
+
+from conftest import create_user, delete_users, login_as, vinylvibes, x
+
+THREADS = 16
+TOGGLES = 5  # odd, so every user ends up liking the post
+
+
+def like_totals(conn, post_pk):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(
+        """
+        SELECT p.post_total_likes + IFNULL((SELECT SUM(shard_delta) FROM post_like_shards WHERE shard_post_fk = p.post_pk), 0) AS counter,
+               (SELECT COUNT(*) FROM post_likes WHERE like_post_fk = p.post_pk) AS likes
+        FROM posts p WHERE p.post_pk = %s
+        """,
+        (post_pk,),
+    )
+    row = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    return int(row["counter"]), int(row["likes"])
+
+
+def hammer(flask_app, post_pk, user_pks):
+    errors = []
+
+    def worker(user_pk):
+        client = flask_app.test_client()
+        login_as(client, user_pk)
+        for _ in range(TOGGLES):
+            response = client.post(f"/api/posts/{post_pk}/like")
+            if response.status_code != 200:
+                errors.append(response.get_json())
+
+    threads = [threading.Thread(target=worker, args=(user_pk,)) for user_pk in user_pks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_concurrent_likes_keep_counter_in_step(flask_app, mysql, monkeypatch):
+    # Every like counts as hot, so the sharded path is exercised alongside the plain counter
+    monkeypatch.setattr(vinylvibes, "like_tracker", x.HotKeyTracker(THREADS // 2, 60, 60))
+    user_pks = [uuid.uuid4().hex for _ in range(THREADS)]
+    post_pk = uuid.uuid4().hex
+    try:
+        for user_pk in user_pks:
+            create_user(mysql, user_pk)
+        cursor = mysql.cursor()
+        cursor.execute(
+            "INSERT INTO posts (post_pk, post_user_fk, post_message, post_created_at) VALUES (%s, %s, 'hammer', UNIX_TIMESTAMP())",
+            (post_pk, user_pks[0]),
+        )
+        mysql.commit()
+        cursor.close()
+
+        assert hammer(flask_app, post_pk, user_pks) == []
+
+        counter, likes = like_totals(mysql, post_pk)
+        assert likes == THREADS
+        assert counter == likes
+
+        # Readers see the unfolded shards too, not just the posts column
+        client = flask_app.test_client()
+        login_as(client, user_pks[0])
+        state = client.post("/api/posts/state", json={"post_pks": [post_pk]}).get_json()
+        assert state["posts"][post_pk]["likes"] == THREADS
+
+        vinylvibes.fold_like_shards()
+        assert like_totals(mysql, post_pk) == (THREADS, THREADS)
+    finally:
+        delete_users(mysql, user_pks)
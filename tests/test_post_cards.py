@@ -0,0 +1,43 @@
+import uuid
+
+from conftest import create_user, delete_users, login_as
+
+
+def post_version(conn, post_pk):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT post_version FROM posts WHERE post_pk = %s", (post_pk,))
+    version = cursor.fetchone()["post_version"]
+    conn.commit()
+    cursor.close()
+    return version
+
+
+def test_profile_update_invalidates_cards_the_user_commented_on(flask_app, mysql):
+    author_pk, commenter_pk = uuid.uuid4().hex, uuid.uuid4().hex
+    post_pk = uuid.uuid4().hex
+    try:
+        create_user(mysql, author_pk)
+        create_user(mysql, commenter_pk)
+        cursor = mysql.cursor()
+        cursor.execute(
+            "INSERT INTO posts (post_pk, post_user_fk, post_message, post_created_at) VALUES (%s, %s, 'cards', UNIX_TIMESTAMP())",
+            (post_pk, author_pk),
+        )
+        cursor.execute(
+            "INSERT INTO comments (comment_pk, comment_post_fk, comment_user_fk, comment_body, comment_created_at) VALUES (%s, %s, %s, 'hi', UNIX_TIMESTAMP())",
+            (uuid.uuid4().hex, post_pk, commenter_pk),
+        )
+        mysql.commit()
+        cursor.close()
+        before = post_version(mysql, post_pk)
+
+        client = flask_app.test_client()
+        login_as(client, commenter_pk)
+        response = client.post(
+            "/api/profile",
+            data={"email": f"{commenter_pk}@test.invalid", "username": f"r{commenter_pk[:19]}", "first_name": "Renamed", "last_name": "User"},
+        )
+        assert response.status_code == 200, response.get_json()
+        assert post_version(mysql, post_pk) > before
+    finally:
+        delete_users(mysql, [author_pk, commenter_pk])
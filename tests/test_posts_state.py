@@ -0,0 +1,21 @@
+import pytest
+
+from conftest import ADMIN_PK, vinylvibes
+
+
+@pytest.fixture
+def client(flask_app, monkeypatch):
+    monkeypatch.setattr(vinylvibes, "current_user", lambda: {"user_pk": ADMIN_PK, "user_blocked_at": 0})
+    return flask_app.test_client()
+
+
+@pytest.mark.parametrize("body", [["a" * 32], "a" * 32, 42, True])
+def test_non_object_json_body_is_a_bad_request(client, body):
+    response = client.post("/api/posts/state", json=body)
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+
+def test_empty_list_needs_no_database(client):
+    response = client.post("/api/posts/state", json={"post_pks": []})
+    assert response.get_json() == {"status": "ok", "posts": {}}
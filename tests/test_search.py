@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+import pytest
+
+from conftest import ADMIN_PK, vinylvibes, x
+
+
+def test_search_cursor_round_trips_score_exactly():
+    score = Decimal("7.123457")  # what CAST(MATCH(...) AS DECIMAL(12,6)) returns
+    cursor = x.encode_search_cursor(score, ADMIN_PK)
+    assert cursor == f"7.123457_{ADMIN_PK}"
+    assert x.validate_search_cursor(cursor) == ("7.123457", ADMIN_PK)
+
+
+@pytest.mark.parametrize("value", ["7.1_" + ADMIN_PK, "7.123457_" + ADMIN_PK + "--", "nan_" + ADMIN_PK, "1e5_" + ADMIN_PK])
+def test_search_cursor_rejects_malformed_values(value):
+    with pytest.raises(Exception) as error:
+        x.validate_search_cursor(value)
+    assert error.value.args[1] == 400
+
+
+def test_feed_cursor_accepts_admin_pk():
+    assert x.validate_cursor(x.encode_cursor(1700000000, ADMIN_PK)) == (1700000000, ADMIN_PK)
+
+
+class NullCursor:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def search_client(flask_app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(vinylvibes, "current_user", lambda: {"user_pk": ADMIN_PK, "user_blocked_at": 0})
+    monkeypatch.setattr(x, "db", lambda: (NullCursor(), NullCursor()))
+    monkeypatch.setattr(vinylvibes, "search_users", lambda cursor, term, after=None: (calls.append(("users", term)) or [], ""))
+    monkeypatch.setattr(vinylvibes, "search_posts", lambda cursor, term, after=None: (calls.append(("posts", term)) or [], ""))
+    monkeypatch.setattr(vinylvibes, "search_cache", x.LRUCache(16, ttl=60))
+    return flask_app.test_client(), calls
+
+
+def test_repeated_search_is_served_from_cache(search_client):
+    client, calls = search_client
+    first = client.get("/api/search", query_string={"search_for": "Blue  Note"})
+    second = client.post("/api/search", data={"search_for": " blue note "})
+    assert first.get_json() == second.get_json()
+    assert calls == [("users", "blue note"), ("posts", "blue note")]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+
+def test_search_cache_is_versioned_by_changes(search_client):
+    client, calls = search_client
+    client.get("/api/search", query_string={"search_for": "vinyl"})
+    vinylvibes.bump_search_version()
+    client.get("/api/search", query_string={"search_for": "vinyl"})
+    assert len(calls) == 4
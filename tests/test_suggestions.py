@@ -0,0 +1,59 @@
+import uuid
+
+from conftest import create_user, delete_users, vinylvibes, x
+
+
+def follow(conn, follower_pk, following_pk):
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO follows (follow_pk, follow_follower_fk, follow_following_fk, follow_created_at) VALUES (%s, %s, %s, UNIX_TIMESTAMP())",
+        (uuid.uuid4().hex, follower_pk, following_pk),
+    )
+    conn.commit()
+    cursor.close()
+
+
+def suggestion_score(conn, user_pk, target_pk):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT suggestion_score FROM suggestions WHERE suggestion_user_fk = %s AND suggestion_target_fk = %s", (user_pk, target_pk))
+    row = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    return row["suggestion_score"] if row else None
+
+
+def test_follow_adjusts_stored_suggestions_incrementally(mysql):
+    me, friend, friend_of_friend = (uuid.uuid4().hex for _ in range(3))
+    try:
+        for user_pk in (me, friend, friend_of_friend):
+            create_user(mysql, user_pk)
+        follow(mysql, friend, friend_of_friend)
+        follow(mysql, me, friend)
+
+        vinylvibes.apply_follow_to_suggestions(me, friend, True)
+        assert suggestion_score(mysql, me, friend_of_friend) >= vinylvibes.MUTUAL_WEIGHT
+
+        vinylvibes.apply_follow_to_suggestions(me, friend, False)
+        assert suggestion_score(mysql, me, friend_of_friend) < vinylvibes.MUTUAL_WEIGHT
+    finally:
+        delete_users(mysql, [me, friend, friend_of_friend])
+
+
+class EmptyCursor:
+    def execute(self, *args):
+        pass
+
+    def fetchall(self):
+        return []
+
+
+def test_refresh_is_scheduled_once_per_interval_and_tracking_is_bounded(monkeypatch):
+    monkeypatch.setattr(vinylvibes, "_suggestions_refreshed", x.LRUCache(2, ttl=60))
+    scheduled = []
+    monkeypatch.setattr(x, "run_in_background", lambda fn, *args: scheduled.append(args))
+    for _ in range(3):
+        vinylvibes.get_suggestions(EmptyCursor(), "a" * 32)
+    assert scheduled == [("a" * 32,)]
+    for i in range(3):
+        vinylvibes.get_suggestions(EmptyCursor(), f"{i:032d}")
+    assert len(vinylvibes._suggestions_refreshed) == 2
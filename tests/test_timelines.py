@@ -0,0 +1,44 @@
+import uuid
+
+from conftest import create_user, delete_users, login_as, vinylvibes, x
+
+
+def execute(conn, sql, params=()):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(sql, params)
+    rows = cursor.fetchall() if cursor.with_rows else []
+    conn.commit()
+    cursor.close()
+    return rows
+
+
+def test_author_dropping_to_fanout_limit_is_backfilled(flask_app, mysql, monkeypatch):
+    monkeypatch.setattr(x, "FANOUT_MAX_FOLLOWERS", 1)
+    monkeypatch.setattr(x, "run_in_background", lambda fn, *args: fn(*args))
+    author, stays, leaves = (uuid.uuid4().hex for _ in range(3))
+    post_pk = uuid.uuid4().hex
+    try:
+        for user_pk in (author, stays, leaves):
+            create_user(mysql, user_pk)
+        for follower_pk in (stays, leaves):
+            execute(
+                mysql,
+                "INSERT INTO follows (follow_pk, follow_follower_fk, follow_following_fk, follow_created_at) VALUES (%s, %s, %s, UNIX_TIMESTAMP())",
+                (uuid.uuid4().hex, follower_pk, author),
+            )
+        execute(mysql, "UPDATE users SET user_total_followers = 2 WHERE user_pk = %s", (author,))
+        # Posted while above the limit, so it was never fanned out
+        execute(
+            mysql,
+            "INSERT INTO posts (post_pk, post_user_fk, post_message, post_created_at) VALUES (%s, %s, 'pull mode', UNIX_TIMESTAMP())",
+            (post_pk, author),
+        )
+
+        client = flask_app.test_client()
+        login_as(client, leaves)
+        assert client.post(f"/api/follow/{author}").get_json()["following"] is False
+
+        rows = execute(mysql, "SELECT timeline_post_fk FROM timelines WHERE timeline_user_fk = %s", (stays,))
+        assert [row["timeline_post_fk"] for row in rows] == [post_pk]
+    finally:
+        delete_users(mysql, [author, stays, leaves])
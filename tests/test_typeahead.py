@@ -0,0 +1,17 @@
+from conftest import vinylvibes, x
+
+
+def record(user_pk, username):
+    return {"user_pk": user_pk, "user_username": username, "user_first_name": "", "user_last_name": "", "user_avatar_path": ""}
+
+
+def test_self_is_filtered_before_the_limit():
+    index = x.PrefixIndex()
+    index.rebuild([record(f"{i:032d}", f"anna{i}") for i in range(5)])
+    users = index.search("anna", limit=3, exclude=f"{0:032d}")
+    assert [u["user_pk"] for u in users] == [f"{i:032d}" for i in (1, 2, 3)]
+
+
+def test_index_is_not_built_on_import():
+    assert not vinylvibes.typeahead_index.ready
+    assert "build_typeahead" not in x._periodic_jobs
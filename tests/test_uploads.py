@@ -0,0 +1,92 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from conftest import x
+
+GPS_IFD = 0x8825
+
+
+def photo_with_gps(fmt="JPEG"):
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"
+    exif[GPS_IFD] = {1: "N", 2: (55.0, 40.0, 30.0), 3: "E", 4: (12.0, 34.0, 56.0)}
+    exif[0x0112] = 6  # rotated 90 degrees
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 20), (200, 30, 30)).save(buffer, fmt, exif=exif.tobytes())
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize("fmt, ext", [("JPEG", "jpg"), ("PNG", "png"), ("WEBP", "webp")])
+def test_save_upload_strips_metadata_without_touching_pixels(tmp_path, fmt, ext):
+    source = photo_with_gps(fmt)
+    with Image.open(io.BytesIO(source.getvalue())) as original:
+        pixels = original.convert("RGB").tobytes()
+    path = x.save_upload(FileStorage(source, filename=f"me.{ext}"), str(tmp_path))
+    with open(path, "rb") as file:
+        stored_bytes = file.read()
+    assert b"PhoneMaker" not in stored_bytes
+    with Image.open(path) as stored:
+        exif = stored.getexif()
+        assert GPS_IFD not in exif and 0x010F not in exif
+        assert dict(exif) == ({0x0112: 6} if fmt == "JPEG" else {})  # JPEGs keep only the orientation
+        assert stored.convert("RGB").tobytes() == pixels
+
+
+def test_save_upload_rejects_a_broken_image(tmp_path):
+    broken = FileStorage(io.BytesIO(b"not an image"), filename="me.png")
+    with pytest.raises(Exception) as error:
+        x.save_upload(broken, str(tmp_path))
+    assert error.value.args[1] == 400
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_process_image_runs_in_spawned_workers(tmp_path):
+    path = x.save_upload(FileStorage(photo_with_gps(), filename="me.jpg"), str(tmp_path))
+    done = threading.Event()
+    results = []
+    x.process_image(path, (10, 400), lambda info: (results.append(info), done.set()))
+    assert done.wait(60)
+    assert x._image_pool._mp_context.get_start_method() == "spawn"
+    assert results == [{"width": 20, "height": 40, "variants": "10,20"}]
+
+
+@pytest.fixture
+def upload_folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(x, "UPLOAD_AVATAR_FOLDER", str(tmp_path / "avatars"))
+    monkeypatch.setattr(x, "UPLOAD_MEDIA_FOLDER", str(tmp_path / "media"))
+    return tmp_path
+
+
+def test_collect_uploads_sweeps_orphans_and_keeps_referenced_files(mysql, upload_folders):
+    kept = x.save_upload(FileStorage(photo_with_gps(), filename="kept.jpg"), x.UPLOAD_MEDIA_FOLDER)
+    orphan = x.save_upload(FileStorage(photo_with_gps("PNG"), filename="orphan.png"), x.UPLOAD_MEDIA_FOLDER)
+    old = time.time() - x.UPLOAD_GC_GRACE - 60
+    for path in (kept, orphan):
+        os.utime(path, (old, old))
+    cursor = mysql.cursor()
+    x.add_upload_ref(cursor, kept)
+    mysql.commit()
+    try:
+        x.collect_uploads()
+        assert os.path.exists(kept)
+        assert not os.path.exists(orphan)
+    finally:
+        cursor.execute("DELETE FROM uploads WHERE upload_path = %s", (kept,))
+        mysql.commit()
+        cursor.close()
+
+
+def test_add_upload_ref_refuses_a_collected_file(mysql, upload_folders):
+    cursor = mysql.cursor()
+    with pytest.raises(Exception) as error:
+        x.add_upload_ref(cursor, str(upload_folders / "media" / "gone.jpg"))
+    mysql.rollback()
+    cursor.close()
+    assert error.value.args[1] == 409
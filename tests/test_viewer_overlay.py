@@ -0,0 +1,29 @@
+from conftest import ADMIN_PK, vinylvibes
+
+
+def make_post(owner_pk):
+    return {
+        "post_pk": "a" * 32, "post_user_fk": owner_pk, "post_message": "Blue Note reissue", "post_image_path": "",
+        "post_version": 1, "like_count": 3, "liked_by_me": 0, "comment_count": 0,
+        "user_username": "admin", "user_first_name": "Admin", "user_last_name": "", "user_avatar_path": "https://x/a.png",
+        "user_avatar_variants": "",
+    }
+
+
+def render_card(flask_app, owner_pk, viewer):
+    vinylvibes.post_card_cache.clear()
+    with flask_app.test_request_context():
+        return str(vinylvibes.render_post_cards(None, [make_post(owner_pk)], viewer, "english")[0])
+
+
+def test_admin_owned_post_gets_actions_for_admin(flask_app):
+    html = render_card(flask_app, ADMIN_PK, {"user_pk": ADMIN_PK, "user_role": "admin"})
+    assert "js-edit-post" in html
+    assert "<!--viewer:" not in html
+
+
+def test_admin_owned_post_hides_actions_from_other_users(flask_app):
+    html = render_card(flask_app, ADMIN_PK, {"user_pk": "b" * 32, "user_role": "user"})
+    assert "js-edit-post" not in html
+    assert "like-count" in html
+    assert "<!--viewer:" not in html
@@ -1,16 +1,37 @@
+import atexit
+import bisect
+import codecs
+import csv
+import glob
+import gzip
+import hashlib
 import json
+import multiprocessing
 import os
+import queue
 import re
+import secrets
 import smtplib
+import sys
+import tempfile
+import threading
 import time
-import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from functools import wraps
+from types import MappingProxyType
 
+import brotli
 import dictionary
 import mysql.connector
-from flask import make_response, request
+import requests
+import urllib3
+from PIL import Image, ImageOps
+from flask import g, has_app_context, has_request_context, make_response, request, session
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
 from werkzeug.utils import secure_filename
 
 ##############################
@@ -18,8 +39,14 @@ from werkzeug.utils import secure_filename
 ##############################
 allowed_languages = ["english", "danish", "spanish"]
 default_language = "english"
-UPLOAD_AVATAR_FOLDER = os.path.join("static", "uploads", "avatars")
-UPLOAD_MEDIA_FOLDER = os.path.join("static", "uploads", "media")
+DICTIONARY_PATH = "dictionary.json"
+DICTIONARY_META_PATH = "dictionary.meta.json"  # ETag/Last-Modified of the last sheet download
+DICTIONARY_SYNC_TIMEOUT = (5, float(os.getenv("DICTIONARY_SYNC_TIMEOUT", "20")))  # connect, read seconds
+DICTIONARY_SYNC_DEADLINE = float(os.getenv("DICTIONARY_SYNC_DEADLINE", "60"))  # seconds for the whole download
+TRANSLATION_CHECK_INTERVAL = float(os.getenv("TRANSLATION_CHECK_INTERVAL", "2"))  # seconds between dictionary.json mtime checks
+UPLOAD_ROOT = os.path.join("static", "uploads")
+UPLOAD_AVATAR_FOLDER = os.path.join(UPLOAD_ROOT, "avatars")
+UPLOAD_MEDIA_FOLDER = os.path.join(UPLOAD_ROOT, "media")
 os.makedirs(UPLOAD_AVATAR_FOLDER, exist_ok=True)
 os.makedirs(UPLOAD_MEDIA_FOLDER, exist_ok=True)
 
@@ -29,48 +56,782 @@ NAME_MIN, NAME_MAX = 2, 40
 PASSWORD_MIN, PASSWORD_MAX = 6, 64
 POST_MIN_LEN, POST_MAX_LEN = 1, 280
 COMMENT_MIN_LEN, COMMENT_MAX_LEN = 1, 240
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", "20"))
+COMMENT_PREVIEW_LIMIT = int(os.getenv("COMMENT_PREVIEW_LIMIT", "3"))  # latest comments rendered on each card
+COMMENT_PAGE_SIZE = int(os.getenv("COMMENT_PAGE_SIZE", "10"))
+POST_STATE_MAX = 100  # post ids per /api/posts/state call
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+FULLTEXT_MIN_TOKEN = int(os.getenv("FULLTEXT_MIN_TOKEN", "3"))  # must match innodb_ft_min_token_size
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "30"))  # also how long other workers may serve results from before a change
+SEARCH_CACHE_MAX_ITEMS = int(os.getenv("SEARCH_CACHE_MAX_ITEMS", "2000"))
+TYPEAHEAD_LIMIT = 8
+TYPEAHEAD_REBUILD_INTERVAL = int(os.getenv("TYPEAHEAD_REBUILD_INTERVAL", "300"))  # picks up changes made by other workers
+FANOUT_MAX_FOLLOWERS = int(os.getenv("FANOUT_MAX_FOLLOWERS", "10000"))  # above this, followers merge the author's posts on read
+TIMELINE_BACKFILL = int(os.getenv("TIMELINE_BACKFILL", "100"))  # posts copied into a timeline on follow
+SUGGESTIONS_SHOWN = 5
+SUGGESTION_POOL_SIZE = int(os.getenv("SUGGESTION_POOL_SIZE", "20"))  # candidates stored per user
+SUGGESTION_REFRESH_INTERVAL = int(os.getenv("SUGGESTION_REFRESH_INTERVAL", "3600"))
+SUGGESTION_TRACKED_USERS = int(os.getenv("SUGGESTION_TRACKED_USERS", "10000"))  # users whose last refresh time is remembered
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "4"))
+LIKE_SHARD_COUNT = int(os.getenv("LIKE_SHARD_COUNT", "16"))  # counter slots per hot post
+LIKE_SHARD_THRESHOLD = int(os.getenv("LIKE_SHARD_THRESHOLD", "20"))  # likes within LIKE_SHARD_WINDOW that make a post hot
+LIKE_SHARD_WINDOW = int(os.getenv("LIKE_SHARD_WINDOW", "10"))
+LIKE_SHARD_HOT_SECONDS = int(os.getenv("LIKE_SHARD_HOT_SECONDS", "300"))
+LIKE_SHARD_FOLD_INTERVAL = int(os.getenv("LIKE_SHARD_FOLD_INTERVAL", "5"))
+LIKE_SHARD_FOLD_BATCH = int(os.getenv("LIKE_SHARD_FOLD_BATCH", "20"))  # posts folded per transaction
+FRAGMENT_CACHE_MAX_ITEMS = int(os.getenv("FRAGMENT_CACHE_MAX_ITEMS", "5000"))
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "mariadb"),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", "password"),
+    "database": os.getenv("DB_NAME", "vinylvibes"),
+}
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # seconds to wait for a free connection
+DB_POOL_MAX_LIFETIME = int(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # recycle connections older than this
+DB_DEADLOCK_RETRIES = 3
+SESSION_LIFETIME = int(os.getenv("SESSION_LIFETIME", str(7 * 24 * 3600)))  # seconds of inactivity before a session expires
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "30"))  # how long another worker's writes can go unseen
+SESSION_CACHE_MAX_ITEMS = int(os.getenv("SESSION_CACHE_MAX_ITEMS", "10000"))
+IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", "10"))  # how long another worker's block/profile edit can go unseen
+IDENTITY_CACHE_MAX_ITEMS = int(os.getenv("IDENTITY_CACHE_MAX_ITEMS", "10000"))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "600"))
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))  # close a worker's connection after this long without mail
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "1000"))
+EMAIL_ENQUEUE_TIMEOUT = 1.0  # seconds a request waits for room in a full queue before giving up
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BASE = float(os.getenv("EMAIL_RETRY_BASE", "2"))  # seconds; doubles per attempt
+EMAIL_SHUTDOWN_TIMEOUT = float(os.getenv("EMAIL_SHUTDOWN_TIMEOUT", "10"))  # seconds to finish queued mail on exit
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_RELAY_INTERVAL = float(os.getenv("OUTBOX_RELAY_INTERVAL", "5"))  # seconds between polls; writers also nudge the relay
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_GC_GRACE = int(os.getenv("UPLOAD_GC_GRACE", "3600"))  # unreferenced files younger than this are kept
+UPLOAD_GC_INTERVAL = int(os.getenv("UPLOAD_GC_INTERVAL", "3600"))
+MEDIA_OFFLOAD = os.getenv("MEDIA_OFFLOAD", "")  # "", "accel" (nginx X-Accel-Redirect) or "sendfile" (X-Sendfile)
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/protected-media/")  # internal nginx location aliased to UPLOAD_ROOT
+MEDIA_MAX_AGE = 3600  # for legacy uploads whose names are not content hashes
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+ASSET_FILES = ("app.css", "app.js")  # relative to static/
+ASSET_BUILD_FOLDER = os.path.join("static", "build")
+IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}  # gif is kept as uploaded so animations survive
+IMAGE_WIDTHS = (320, 640, 1080)  # post image variants
+AVATAR_WIDTHS = (40, 100)
+IMAGE_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))  # same query more than N times per request
 
 
 ##############################
 # DATABASE
 ##############################
+class PooledConnection:
+    """
+    Thin wrapper around a MySQL connection handed out by ConnectionPool.
+    close() gives the connection back to the pool instead of closing the socket,
+    and is a no-op for the connection bound to the current Flask request.
+    """
+
+    def __init__(self, pool, conn, created_at):
+        self._pool = pool
+        self._conn = conn
+        self.created_at = created_at
+        self.request_bound = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if not self.request_bound:
+            self.release()
+
+    def release(self):
+        if self._conn is not None:
+            self._pool.release(self)
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of MySQL connections.
+    Connections are pinged on checkout and recycled once they pass max_lifetime.
+    """
+
+    def __init__(self, size, timeout, max_lifetime, **config):
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.config = config
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def checkout(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise Exception("Database busy", 503)
+        try:
+            while True:
+                try:
+                    conn, created_at = self._idle.get_nowait()
+                except queue.Empty:
+                    conn, created_at = mysql.connector.connect(**self.config), time.time()
+                    return PooledConnection(self, conn, created_at)
+                if time.time() - created_at < self.max_lifetime and self._healthy(conn):
+                    return PooledConnection(self, conn, created_at)
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, pooled):
+        conn, pooled._conn = pooled._conn, None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put((conn, pooled.created_at))
+        except Exception:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def _healthy(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_LIFETIME, **DB_CONFIG)
+    return _pool
+
+
 def db():
     """
     Returns a database connection and cursor with dictionary results.
+    Inside a request the same pooled connection is reused for every call and
+    handed back by release_db() on teardown; elsewhere conn.close() returns it.
     """
-    conn = mysql.connector.connect(
-        host="mariadb",
-        user="root",
-        password="password",
-        database="vinylvibes",
-    )
-    return conn, conn.cursor(dictionary=True)
+    if has_app_context():
+        conn = g.get("db_conn")
+        if conn is None:
+            conn = get_pool().checkout()
+            conn.request_bound = True
+            g.db_conn = conn
+    else:
+        conn = get_pool().checkout()
+    return conn, InstrumentedCursor(conn.cursor(dictionary=True))
+
+
+def is_deadlock(ex):
+    """
+    True when InnoDB picked this transaction as the deadlock victim (1213) and rolled it back; the whole transaction can be retried.
+    """
+    return getattr(ex, "errno", None) == 1213
+
+
+def release_db(exception=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        # Commits writes queued for teardown (the session save); anything else uncommitted is rolled back by release()
+        if g.pop("db_commit", False) and exception is None:
+            try:
+                conn.commit()
+            except Exception as ex:
+                print("TEARDOWN COMMIT ERROR:", ex, flush=True)
+        conn.release()
+
+
+##############################
+# BACKGROUND JOBS
+##############################
+_background = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="background")
+
+
+def run_in_background(fn, *args, **kwargs):
+    """
+    Runs fn on the shared background thread pool. Errors are logged, never raised to the caller.
+    """
+    future = _background.submit(fn, *args, **kwargs)
+    future.add_done_callback(_log_background_error)
+    return future
+
+
+def _log_background_error(future):
+    ex = future.exception()
+    if ex:
+        print("BACKGROUND ERROR:", ex, flush=True)
+
+
+_periodic_jobs = {}
+_periodic_lock = threading.Lock()
+
+
+def schedule_periodic(name: str, interval: float, fn):
+    """
+    Starts a daemon thread that calls fn every interval seconds. Only the first call per name starts a thread.
+    """
+    with _periodic_lock:
+        if name in _periodic_jobs:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    fn()
+                except Exception as ex:
+                    print(f"PERIODIC {name} ERROR:", ex, flush=True)
+
+        _periodic_jobs[name] = threading.Thread(target=loop, name=name, daemon=True)
+        _periodic_jobs[name].start()
+
+
+##############################
+# CACHING
+##############################
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and,
+    optionally, by the total size of the cached values in bytes.
+    With a ttl, entries also expire that many seconds after they were set.
+    """
+
+    def __init__(self, max_items=1000, max_bytes=None, ttl=None, sizeof=sys.getsizeof):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[2] and entry[2] < time.time():
+                self.size -= self._entries.pop(key)[1]
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes else 0
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, time.time() + self.ttl if self.ttl else 0)
+            self.size += size
+            while self._entries and (len(self._entries) > self.max_items or (self.max_bytes and self.size > self.max_bytes)):
+                self.size -= self._entries.popitem(last=False)[1][1]
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class HotKeyTracker:
+    """
+    Counts hits per key over a sliding window. A key that reaches threshold hits
+    within the window stays hot for hot_seconds.
+    """
+
+    def __init__(self, threshold, window, hot_seconds):
+        self.threshold = threshold
+        self.window = window
+        self.hot_seconds = hot_seconds
+        self._hits = {}
+        self._hot_until = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        now = time.time()
+        with self._lock:
+            if self._hot_until.get(key, 0) > now:
+                return True
+            hits = self._hits.setdefault(key, deque(maxlen=self.threshold))
+            hits.append(now)
+            if len(hits) >= self.threshold and now - hits[0] <= self.window:
+                self._hot_until[key] = now + self.hot_seconds
+                del self._hits[key]
+                return True
+            if len(self._hits) > 10000:
+                self._prune(now)
+            return False
+
+    def _prune(self, now):
+        self._hits = {k: v for k, v in self._hits.items() if now - v[-1] <= self.window}
+        self._hot_until = {k: v for k, v in self._hot_until.items() if v > now}
+
+
+class PrefixIndex:
+    """
+    Sorted in-memory index of lowercase name tokens for prefix (typeahead) lookups.
+    Each record is a dict with a "user_pk" plus the fields returned to the client.
+    """
+
+    FIELDS = ("user_username", "user_first_name", "user_last_name")
+
+    def __init__(self):
+        self.ready = False
+        self._keys = []  # sorted (token, user_pk)
+        self._records = {}  # user_pk -> record
+        self._lock = threading.Lock()
+
+    def _tokens(self, record):
+        tokens = {str(record.get(field) or "").lower() for field in self.FIELDS}
+        tokens.add(f"{record.get('user_first_name') or ''} {record.get('user_last_name') or ''}".strip().lower())
+        tokens.discard("")
+        return tokens
+
+    def rebuild(self, records):
+        keys, by_pk = [], {}
+        for record in records:
+            by_pk[record["user_pk"]] = record
+            keys.extend((token, record["user_pk"]) for token in self._tokens(record))
+        keys.sort()
+        with self._lock:
+            self._keys, self._records, self.ready = keys, by_pk, True
+
+    def add(self, record):
+        with self._lock:
+            self._remove(record["user_pk"])
+            self._records[record["user_pk"]] = record
+            for token in self._tokens(record):
+                bisect.insort(self._keys, (token, record["user_pk"]))
+
+    def remove(self, user_pk):
+        with self._lock:
+            self._remove(user_pk)
+
+    def _remove(self, user_pk):
+        record = self._records.pop(user_pk, None)
+        if record is None:
+            return
+        for token in self._tokens(record):
+            i = bisect.bisect_left(self._keys, (token, user_pk))
+            if i < len(self._keys) and self._keys[i] == (token, user_pk):
+                del self._keys[i]
+
+    def search(self, prefix, limit=TYPEAHEAD_LIMIT, exclude=None):
+        """
+        Returns up to limit records with a token starting with prefix, skipping the user_pk given as exclude
+        before the limit is applied, so the caller's own record never costs a slot.
+        """
+        prefix = prefix.strip().lower()
+        results, seen = [], set()
+        if not prefix:
+            return results
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (prefix,))
+            while i < len(self._keys) and len(results) < limit and self._keys[i][0].startswith(prefix):
+                user_pk = self._keys[i][1]
+                if user_pk not in seen and user_pk != exclude:
+                    seen.add(user_pk)
+                    results.append(self._records[user_pk])
+                i += 1
+        return results
+
+
+##############################
+# SESSIONS
+##############################
+class ServerSession(CallbackDict, SessionMixin):
+    """
+    Session data kept server side; the cookie only carries the random session id.
+    payload is the JSON last read from or written to the store, used to skip unchanged writes.
+    """
+
+    def __init__(self, data=None, sid=None, payload=None, expires_at=0):
+        super().__init__(data or {}, on_update=self._on_update)
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.payload = payload
+        self.expires_at = expires_at
+        self.modified = False
+
+    def _on_update(self, _):
+        self.modified = True
+
+
+class SqlSessionInterface(SessionInterface):
+    """
+    Stores sessions in the MariaDB sessions table with an in-process LRU in front.
+    A write only happens when the data changed or the session is past half its lifetime.
+    Reads and writes use the request's own connection; writes are committed by release_db() on teardown.
+    """
+
+    serializer = json
+
+    def __init__(self, lifetime=SESSION_LIFETIME):
+        self.lifetime = lifetime
+        self.cache = LRUCache(SESSION_CACHE_MAX_ITEMS, ttl=SESSION_CACHE_TTL)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSession()
+        row = self.cache.get(sid)
+        if row is None:
+            conn, cursor = db()
+            try:
+                cursor.execute(
+                    "SELECT session_data, session_expires_at FROM sessions WHERE session_id = %s AND session_expires_at > %s",
+                    (sid, int(time.time())))
+                row = cursor.fetchone() or {}
+            finally:
+                cursor.close()
+                conn.close()
+            if row:
+                self.cache.set(sid, row)
+        if not row or row["session_expires_at"] <= time.time():
+            return ServerSession()
+        return ServerSession(json.loads(row["session_data"]), sid, row["session_data"], row["session_expires_at"])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.payload is not None:
+                self._write("DELETE FROM sessions WHERE session_id = %s", (session.sid,))
+                self.cache.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        payload = json.dumps(session, separators=(",", ":"), sort_keys=True)
+        now = int(time.time())
+        if payload == session.payload and session.expires_at - now > self.lifetime // 2:
+            return
+        expires_at = now + self.lifetime
+        self._write(
+            """
+            INSERT INTO sessions (session_id, session_data, session_expires_at) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE session_data = VALUES(session_data), session_expires_at = VALUES(session_expires_at)
+            """,
+            (session.sid, payload, expires_at))
+        self.cache.set(session.sid, {"session_data": payload, "session_expires_at": expires_at})
+        response.set_cookie(
+            name, session.sid, expires=expires_at, domain=domain, path=path,
+            httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app))
+
+    def sweep(self):
+        """
+        Deletes expired sessions in small batches so the table is never locked for long.
+        Runs as a background job, outside any request.
+        """
+        conn, cursor = db()
+        try:
+            while True:
+                cursor.execute("DELETE FROM sessions WHERE session_expires_at < %s LIMIT 1000", (int(time.time()),))
+                conn.commit()
+                if cursor.rowcount < 1000:
+                    break
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _write(self, sql, params):
+        # No second pool checkout: a request already holding its connection could wait on the pool forever
+        conn, cursor = db()
+        try:
+            cursor.execute(sql, params)
+        finally:
+            cursor.close()
+            conn.close()
+        g.db_commit = True
+
+
+##############################
+# QUERY INSTRUMENTATION
+##############################
+class InstrumentedCursor:
+    """
+    Wraps a cursor and records every statement with its duration (execute + fetch) and row count.
+    Inside a request the records are collected on g for sql_report(); elsewhere slow statements are logged directly.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._entry = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._entry = {"sql": operation, "ms": (time.perf_counter() - start) * 1000, "rows": max(self._cursor.rowcount, 0)}
+            if has_app_context():
+                g.setdefault("sql_queries", []).append(self._entry)
+            elif self._entry["ms"] >= SQL_SLOW_QUERY_MS:
+                log_slow_query(self._entry)
+
+    def _timed_fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return getattr(self._cursor, method)(*args)
+        finally:
+            if self._entry is not None:
+                self._entry["ms"] += (time.perf_counter() - start) * 1000
+                self._entry["rows"] = max(self._cursor.rowcount, 0)
+
+    def fetchone(self):
+        return self._timed_fetch("fetchone")
+
+    def fetchmany(self, size=1):
+        return self._timed_fetch("fetchmany", size)
+
+    def fetchall(self):
+        return self._timed_fetch("fetchall")
+
+
+def normalize_sql(sql: str):
+    """
+    Collapses whitespace, literals and IN (...) lists so the same query shape always yields the same string.
+    """
+    sql = re.sub(r"'(?:[^'\\]|\\.)*'", "?", sql)
+    sql = re.sub(r"\b\d+\b", "?", sql)
+    sql = re.sub(r"\bIN\s*\([^)]*\)", "IN (...)", sql, flags=re.IGNORECASE)
+    return " ".join(sql.split())
+
+
+def log_slow_query(entry):
+    print(f"SLOW SQL {entry['ms']:.1f}ms rows={entry['rows']}: {normalize_sql(entry['sql'])}", flush=True)
+
+
+def sql_report(response):
+    """
+    after_request hook: adds a Server-Timing header with the request's SQL totals,
+    logs slow statements and warns about likely N+1 query patterns.
+    """
+    queries = g.pop("sql_queries", [])
+    if not queries:
+        return response
+    total_ms = sum(q["ms"] for q in queries)
+    total_rows = sum(q["rows"] for q in queries)
+    response.headers.add("Server-Timing", f'db;dur={total_ms:.2f};desc="{len(queries)} queries, {total_rows} rows"')
+
+    shapes = {}
+    for entry in queries:
+        if entry["ms"] >= SQL_SLOW_QUERY_MS:
+            log_slow_query(entry)
+        shape = normalize_sql(entry["sql"])
+        shapes[shape] = shapes.get(shape, 0) + 1
+    for shape, count in shapes.items():
+        if count > SQL_N_PLUS_ONE_THRESHOLD:
+            print(f"N+1 SQL {request.method} {request.path} ran {count}x: {shape}", flush=True)
+    return response
 
 
 ##############################
 # LANGUAGE HELPERS
 ##############################
 def set_language(lan: str):
-    global default_language
-    if lan in allowed_languages:
-        default_language = lan
+    """
+    Sets the language for the current request only. default_language is never changed,
+    so concurrent requests on other threads keep their own language.
+    """
+    if lan in allowed_languages and has_app_context():
+        g.lan = lan
+    return get_language()
+
+
+def get_language():
+    if has_request_context():
+        lan = g.get("lan") or session.get("lan")
+        if lan in allowed_languages:
+            return lan
     return default_language
 
 
-def lans(key: str, lan: str | None = None):
+_translations = MappingProxyType({})
+_translations_mtime = None
+_translations_checked = 0.0
+_translations_lock = threading.Lock()
+
+
+def build_translations(data: dict):
+    """
+    Flattens the dictionary.py constants and the dictionary.json data into one read-only map keyed by (key, language).
+    dictionary.json wins; empty cells from the sheet fall through to the constants.
+    """
+    table = {}
+    for source in (vars(dictionary), data):
+        for key, values in source.items():
+            if key.startswith("_") or not isinstance(values, dict):
+                continue
+            for lang, text in values.items():
+                if text:
+                    table[(key, lang)] = text
+    return MappingProxyType(table)
+
+
+def reload_translations(force: bool = False):
+    """
+    Rebuilds the translation table if dictionary.json changed since the last load.
+    The new table replaces the old one in a single assignment, so readers never see a partial table.
+    """
+    global _translations, _translations_mtime
+    try:
+        mtime = os.stat(DICTIONARY_PATH).st_mtime_ns
+    except OSError:
+        mtime = 0
+    with _translations_lock:
+        if force or mtime != _translations_mtime:
+            data = {}
+            if mtime:
+                data = read_json(DICTIONARY_PATH, {})
+            _translations = build_translations(data)
+            _translations_mtime = mtime
+    return _translations
+
+
+def translations():
+    global _translations_checked
+    now = time.monotonic()
+    # Until the first load has finished, every caller goes through the lock instead of reading the empty table
+    if _translations_mtime is None or now - _translations_checked >= TRANSLATION_CHECK_INTERVAL:
+        _translations_checked = now
+        return reload_translations()
+    return _translations
+
+
+def write_atomic(path: str, text: str):
     """
-    Fetches a translation from dictionary.json first, falling back to dictionary.py constants.
+    Writes text to a temp file next to path and renames it over path, so readers see the old or the new file, never half of one.
     """
-    active_lang = lan if lan in allowed_languages else default_language
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=os.path.basename(path))
     try:
-        with open("dictionary.json", "r", encoding="utf-8") as file:
-            data = json.load(file)
-            return data.get(key, {}).get(active_lang, key)
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
     except Exception:
-        pass
+        os.unlink(tmp_path)
+        raise
+
+
+def read_json(path: str, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+def _sheet_lines(res, deadline: float):
+    """
+    Yields the response body as text lines (line endings kept, so quoted multi-line cells survive),
+    raising a 504 once the whole download has taken longer than the deadline.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    for chunk in res.iter_content(UPLOAD_CHUNK_SIZE):
+        if time.monotonic() > deadline:
+            raise Exception("Dictionary sheet timed out", 504)
+        lines = (pending + decoder.decode(chunk)).splitlines(keepends=True)
+        pending = lines.pop() if lines else ""
+        yield from lines
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def sync_dictionary(url: str):
+    """
+    Downloads the translation sheet as CSV and replaces dictionary.json if any key changed.
+    Sends the last ETag/Last-Modified so an unchanged sheet costs a 304, and parses the body as it streams in.
+    A response that is not CSV (e.g. a login page) or has no keys is refused, leaving dictionary.json as it was.
+    Returns the changed keys. Other workers pick the new file up on their next mtime check.
+    """
+    meta = read_json(DICTIONARY_META_PATH, {})
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    deadline = time.monotonic() + DICTIONARY_SYNC_DEADLINE
+    try:
+        with requests.get(url, headers=headers, timeout=DICTIONARY_SYNC_TIMEOUT, stream=True) as res:
+            if res.status_code == 304:
+                return []
+            res.raise_for_status()
+            if "csv" not in res.headers.get("Content-Type", ""):
+                raise Exception("Dictionary sheet is not CSV", 502)
+            reader = csv.DictReader(_sheet_lines(res, deadline))
+            data = {}
+            for row in reader:
+                key = (row.get("key") or "").strip()
+                if key:
+                    data[key] = {language: row.get(language) or "" for language in allowed_languages}
+            if "english" not in (reader.fieldnames or []) or not data:
+                raise Exception("Dictionary sheet is empty", 502)
+            meta = {"etag": res.headers.get("ETag", ""), "last_modified": res.headers.get("Last-Modified", "")}
+    except requests.Timeout:
+        raise Exception("Dictionary sheet timed out", 504)
+    except requests.ConnectionError as ex:
+        # A stall mid-body surfaces as a ConnectionError wrapping urllib3's ReadTimeoutError, not as Timeout
+        if ex.args and isinstance(ex.args[0], urllib3.exceptions.ReadTimeoutError):
+            raise Exception("Dictionary sheet timed out", 504)
+        raise Exception(f"Dictionary sheet unavailable: {ex}", 502)
+    except (requests.RequestException, csv.Error, UnicodeDecodeError) as ex:
+        raise Exception(f"Dictionary sheet unavailable: {ex}", 502)
 
-    value = getattr(dictionary, key, {})
-    return value.get(active_lang, value.get(active_lang[:2], value.get("english", key)))
+    current = read_json(DICTIONARY_PATH, {})
+    changed = sorted(key for key in data.keys() | current.keys() if data.get(key) != current.get(key))
+    if changed:
+        write_atomic(DICTIONARY_PATH, json.dumps(data, ensure_ascii=False, indent=2))
+        reload_translations(force=True)
+    write_atomic(DICTIONARY_META_PATH, json.dumps(meta))
+    return changed
+
+
+def lans(key: str, lan: str | None = None):
+    """
+    Looks up a translation, falling back to English and then to the key itself.
+    """
+    active_lang = lan if lan in allowed_languages else get_language()
+    table = translations()
+    return table.get((key, active_lang)) or table.get((key, "english"), key)
 
 
 ##############################
@@ -91,92 +852,133 @@ def no_cache(view):
 ##############################
 # VALIDATION
 ##############################
-def validate_user_email(lan: str = "english"):
+def validate_user_email(lan: str | None = None):
     user_email = request.form.get("email", "").strip().lower()
     if not re.match(EMAIL_REGEX, user_email):
-        raise Exception(dictionary.invalid_email[lan], 400)
+        raise Exception(lans("invalid_email", lan), 400)
     return user_email
 
 
-def validate_user_username(lan: str = "english"):
+def validate_user_username(lan: str | None = None):
     user_username = request.form.get("username", "").strip()
-    error = dictionary.invalid_username.get(lan, "Invalid username")
+    error = lans("invalid_username", lan)
     if len(user_username) < USERNAME_MIN or len(user_username) > USERNAME_MAX:
         raise Exception(error, 400)
     return user_username
 
 
-def validate_user_first_name(lan: str = "english"):
+def validate_user_first_name(lan: str | None = None):
     user_first_name = request.form.get("first_name", "").strip()
-    error = dictionary.invalid_first_name.get(lan, "Invalid first name")
+    error = lans("invalid_first_name", lan)
     if len(user_first_name) < NAME_MIN or len(user_first_name) > NAME_MAX:
         raise Exception(error, 400)
     return user_first_name
 
 
-def validate_user_last_name(lan: str = "english"):
+def validate_user_last_name(lan: str | None = None):
     user_last_name = request.form.get("last_name", "").strip()
-    error = dictionary.invalid_last_name.get(lan, "Invalid last name")
+    error = lans("invalid_last_name", lan)
     if len(user_last_name) > NAME_MAX:
         raise Exception(error, 400)
     return user_last_name
 
 
-def validate_user_password(lan: str = "english"):
+def validate_user_password(lan: str | None = None):
     user_password = request.form.get("password", "").strip()
     if len(user_password) < PASSWORD_MIN or len(user_password) > PASSWORD_MAX:
-        raise Exception(dictionary.invalid_password[lan], 400)
+        raise Exception(lans("invalid_password", lan), 400)
     return user_password
 
 
-def validate_user_password_confirm(lan: str = "english"):
+def validate_user_password_confirm(lan: str | None = None):
     user_password_confirm = request.form.get("password_confirm", "").strip()
     if len(user_password_confirm) < PASSWORD_MIN or len(user_password_confirm) > PASSWORD_MAX:
-        raise Exception(dictionary.invalid_password[lan], 400)
+        raise Exception(lans("invalid_password", lan), 400)
     return user_password_confirm
 
 
-def validate_post(lan: str = "english"):
+def validate_post(lan: str | None = None):
     post = request.form.get("message", "").strip()
     if len(post) < POST_MIN_LEN or len(post) > POST_MAX_LEN:
-        raise Exception(dictionary.invalid_post[lan], 400)
+        raise Exception(lans("invalid_post", lan), 400)
     return post
 
 
-def validate_comment(lan: str = "english"):
+def validate_comment(lan: str | None = None):
     comment = request.form.get("comment", "").strip()
     if len(comment) < COMMENT_MIN_LEN or len(comment) > COMMENT_MAX_LEN:
-        raise Exception(dictionary.invalid_comment[lan], 400)
+        raise Exception(lans("invalid_comment", lan), 400)
     return comment
 
 
 # Hex-based keys (verification/reset)
-def validate_uuid(value: str, field_name: str = "id", lan: str = "english"):
+def validate_uuid(value: str, field_name: str = "id", lan: str | None = None):
     value = value.strip()
     if not re.fullmatch(r"[0-9a-f]{32}", value):
-        raise Exception(dictionary.invalid_uuid.get(lan, f"Invalid {field_name}"), 400)
+        raise Exception(lans("invalid_uuid", lan), 400)
     return value
 
 
 # Auto-increment primary keys (numeric)
-def validate_pk(value: str, field_name: str = "id", lan: str = "english"):
+def validate_pk(value: str, field_name: str = "id", lan: str | None = None):
     value = str(value).strip()
     if not value.isdigit():
-        raise Exception(dictionary.invalid_uuid.get(lan, f"Invalid {field_name}"), 400)
+        raise Exception(lans("invalid_uuid", lan), 400)
     return int(value)
 
 
-def validate_search_term(lan: str = "english"):
+# Keyset cursors: "<created_at>_<pk>"
+def encode_cursor(created_at: int, pk: str):
+    return f"{int(created_at)}_{pk}"
+
+
+def validate_cursor(value: str, field_name: str = "cursor", lan: str | None = None):
+    value = str(value).strip()
+    match = re.fullmatch(r"(\d+)_([0-9A-Za-z]+)", value)
+    if not match:
+        raise Exception(lans("invalid_uuid", lan), 400)
+    return int(match.group(1)), match.group(2)
+
+
+# Search cursors: "<relevance>_<pk>". Scores are DECIMAL(12,6) in SQL, so the text form round-trips exactly
+def encode_search_cursor(score, pk: str):
+    return f"{score:.6f}_{pk}"
+
+
+def validate_search_cursor(value: str, field_name: str = "cursor", lan: str | None = None):
+    value = str(value).strip()
+    match = re.fullmatch(r"(\d+\.\d{6})_([0-9A-Za-z]+)", value)
+    if not match:
+        raise Exception(lans("invalid_uuid", lan), 400)
+    return match.group(1), match.group(2)
+
+
+def fulltext_terms(term: str):
+    """
+    Splits a search term into FULLTEXT words. Returns (words, short) where short is True
+    when any word is below the FULLTEXT minimum token size and cannot be matched as a whole word.
+    """
+    words = re.findall(r"\w+", term)
+    return words, any(len(word) < FULLTEXT_MIN_TOKEN for word in words)
+
+
+def validate_search_term(lan: str | None = None):
     term = request.values.get("q", "").strip()
     if len(term) < 2:
-        raise Exception(dictionary.invalid_search.get(lan, "Search too short"), 400)
+        raise Exception(lans("invalid_search", lan), 400)
     return term
 
 
 ##############################
 # FILE UPLOADS
 ##############################
-def save_upload(file_storage, target_folder, allowed_extensions=None, prefix="upload"):
+def save_upload(file_storage, target_folder, allowed_extensions=None):
+    """
+    Stores an upload under its sha256 as <folder>/<ab>/<cd>/<sha256>.<ext>, hashing while the bytes are written.
+    Image metadata is stripped first (see strip_image_metadata), since originals are served publicly.
+    Identical content maps to the same path, so a re-upload reuses the existing file.
+    Callers record the reference with add_upload_ref() in the transaction that stores the path.
+    """
     if not file_storage:
         return ""
     filename = secure_filename(file_storage.filename)
@@ -186,41 +988,811 @@ def save_upload(file_storage, target_folder, allowed_extensions=None, prefix="up
     allowed = allowed_extensions or {"png", "jpg", "jpeg", "gif", "webp", "mp4", "mov", "pdf", "mp3"}
     if ext not in allowed:
         raise Exception("Invalid file type", 400)
-    unique_name = f"{prefix}_{uuid.uuid4().hex}.{ext}"
     os.makedirs(target_folder, exist_ok=True)
-    path = os.path.join(target_folder, unique_name)
-    file_storage.save(path)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=target_folder, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for chunk in iter(lambda: file_storage.stream.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                file.write(chunk)
+        if ext in IMAGE_EXTENSIONS:
+            strip_image_metadata(tmp_path)
+            digest = hashlib.sha256()
+            with open(tmp_path, "rb") as file:
+                for chunk in iter(lambda: file.read(UPLOAD_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        name = digest.hexdigest()
+        folder = os.path.join(target_folder, name[:2], name[2:4])
+        path = os.path.join(folder, f"{name}.{ext}")
+        os.makedirs(folder, exist_ok=True)
+        try:
+            os.utime(path)  # tells collect_uploads() the file is in use again
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
     return path.replace("\\", "/")
 
 
+def is_local_upload(path: str):
+    return bool(path) and not path.startswith("http")
+
+
+def add_upload_ref(cursor, path: str):
+    """
+    Counts a reference to path. The row lock taken here is the one collect_uploads() holds while unlinking,
+    so if the file still exists now it stays until this transaction ends; if the collector got there first, raises 409.
+    """
+    if is_local_upload(path):
+        cursor.execute(
+            """
+            INSERT INTO uploads (upload_path, upload_refs, upload_updated_at) VALUES (%s, 1, %s)
+            ON DUPLICATE KEY UPDATE upload_refs = upload_refs + 1, upload_updated_at = VALUES(upload_updated_at)
+            """,
+            (path, int(time.time())),
+        )
+        if not os.path.exists(path):
+            raise Exception("Upload expired, please try again", 409)
+
+
+def drop_upload_ref(cursor, path: str, count: int = 1):
+    if is_local_upload(path):
+        cursor.execute(
+            "UPDATE uploads SET upload_refs = upload_refs - LEAST(upload_refs, %s), upload_updated_at = %s WHERE upload_path = %s",
+            (count, int(time.time()), path),
+        )
+
+
+def _unlink_upload(path: str):
+    removed = 0
+    for file_path in [path] + glob.glob(glob.escape(path.rsplit(".", 1)[0]) + "_*"):
+        try:
+            os.unlink(file_path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _modified_since(path: str, cutoff: int):
+    try:
+        return os.path.getmtime(path) >= cutoff
+    except OSError:
+        return False
+
+
+def collect_uploads(batch: int = 500):
+    """
+    Deletes files (and their image variants) that no post or avatar has referenced for UPLOAD_GC_GRACE seconds.
+    Each file is re-checked under a lock on its uploads row (or the gap where it would be) right before the unlink.
+    add_upload_ref() waits on that lock and then checks the file still exists, so a new reference and a
+    deletion can never both succeed. Files with no row at all, left by a request that failed after saving
+    its upload, are swept from disk once they are older than the grace period.
+    """
+    conn = get_pool().checkout()
+    removed = 0
+    try:
+        cursor = InstrumentedCursor(conn.cursor(dictionary=True))
+        cutoff = int(time.time()) - UPLOAD_GC_GRACE
+        cursor.execute("SELECT upload_path FROM uploads WHERE upload_refs = 0 AND upload_updated_at < %s LIMIT %s", (cutoff, batch))
+        paths = [row["upload_path"] for row in cursor.fetchall()]
+        conn.commit()
+        for path in paths:
+            cursor.execute("SELECT upload_refs, upload_updated_at FROM uploads WHERE upload_path = %s FOR UPDATE", (path,))
+            row = cursor.fetchone()
+            if row and row["upload_refs"] == 0 and row["upload_updated_at"] < cutoff and not _modified_since(path, cutoff):
+                removed += _unlink_upload(path)
+                cursor.execute("DELETE FROM uploads WHERE upload_path = %s", (path,))
+            conn.commit()
+        removed += _sweep_orphan_uploads(conn, cursor, cutoff, batch)
+        cursor.close()
+    finally:
+        conn.close()
+    if removed:
+        print(f"UPLOAD GC removed {removed} files", flush=True)
+    return removed
+
+
+def _sweep_orphan_uploads(conn, cursor, cutoff: int, batch: int):
+    """
+    Removes content-hashed files older than cutoff that have no uploads row, plus stale temp files.
+    """
+    removed, candidates = 0, []
+    for folder in (UPLOAD_AVATAR_FOLDER, UPLOAD_MEDIA_FOLDER):
+        for root, _, names in os.walk(folder):
+            for name in names:
+                file_path = os.path.join(root, name).replace("\\", "/")
+                if _modified_since(file_path, cutoff):
+                    continue
+                match = CONTENT_HASH_NAME.fullmatch(name)
+                if name.startswith((".upload-", ".strip-")):
+                    removed += _unlink_upload(file_path)
+                elif match and not match.group(2):
+                    candidates.append(file_path)
+    for i in range(0, len(candidates), batch):
+        chunk = candidates[i : i + batch]
+        cursor.execute(f"SELECT upload_path FROM uploads WHERE upload_path IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk))
+        known = {row["upload_path"] for row in cursor.fetchall()}
+        conn.commit()
+        for path in chunk:
+            if path in known:
+                continue
+            # Locks the gap, so a concurrent add_upload_ref() for this path waits until the file is gone
+            cursor.execute("SELECT upload_path FROM uploads WHERE upload_path = %s FOR UPDATE", (path,))
+            if cursor.fetchone() is None and not _modified_since(path, cutoff):
+                removed += _unlink_upload(path)
+            conn.commit()
+    return removed
+
+
+CONTENT_HASH_NAME = re.compile(r"([0-9a-f]{64})(_\d+)?\.\w+")
+
+
+def media_url(path: str):
+    """
+    Public URL for a stored upload path. Files under UPLOAD_ROOT go through the /media route.
+    """
+    if not path or path.startswith("http"):
+        return path
+    root = UPLOAD_ROOT.replace("\\", "/") + "/"
+    if path.startswith(root):
+        return "/media/" + path[len(root):]
+    return "/" + path
+
+
+def content_hash_etag(filename: str):
+    """
+    Strong ETag for content-addressed names (the hash plus any variant width), None for anything else.
+    """
+    match = CONTENT_HASH_NAME.fullmatch(os.path.basename(filename))
+    return match.group(1) + (match.group(2) or "") if match else None
+
+
+##############################
+# IMAGES
+##############################
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+
+def variant_path(path: str, width: int, fmt: str):
+    return f"{path.rsplit('.', 1)[0]}_{width}.{fmt}"
+
+
+def image_srcset(path: str, variants: str, fmt: str = "webp"):
+    """
+    Builds a srcset from the comma-separated variant widths stored next to an image path.
+    """
+    widths = [int(width) for width in (variants or "").split(",") if width]
+    return ", ".join(f"{media_url(variant_path(path, width, fmt))} {width}w" for width in widths)
+
+
+JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE}  # APP1 (EXIF/XMP), APP13 (IPTC), COM
+PNG_METADATA_CHUNKS = {b"tEXt", b"zTXt", b"iTXt", b"eXIf", b"tIME"}
+WEBP_METADATA_CHUNKS = {b"EXIF", b"XMP "}
+
+
+def _exif_orientation_segment(orientation: int):
+    """A minimal APP1 segment carrying only the EXIF orientation tag, so stripped photos still display upright."""
+    tiff = b"MM\x00\x2a" + (8).to_bytes(4, "big") + (1).to_bytes(2, "big")
+    tiff += (0x0112).to_bytes(2, "big") + (3).to_bytes(2, "big") + (1).to_bytes(4, "big") + orientation.to_bytes(2, "big") + b"\x00\x00"
+    payload = b"Exif\x00\x00" + tiff + (0).to_bytes(4, "big")
+    return b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+def _strip_jpeg(data: bytes, orientation: int):
+    segments, i = [], 2
+    while i + 4 <= len(data):
+        marker = data[i + 1]
+        if data[i] != 0xFF:
+            raise ValueError("bad JPEG marker")
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0xDA:
+            # Scan data up to EOI; anything after it (MPF extra images with their own EXIF) is dropped
+            eoi = data.find(b"\xff\xd9", i)
+            segments.append(data[i:] if eoi < 0 else data[i : eoi + 2])
+            break
+        end = i + 2 + int.from_bytes(data[i + 2 : i + 4], "big")
+        segment = data[i:end]
+        if marker not in JPEG_METADATA_MARKERS and not (marker == 0xE2 and segment[4:8] == b"MPF\x00"):
+            segments.append(segment)
+        i = end
+    if orientation > 1:
+        at = 1 if segments and segments[0][1] == 0xE0 else 0  # after the JFIF APP0, which must come first
+        segments.insert(at, _exif_orientation_segment(orientation))
+    return b"\xff\xd8" + b"".join(segments)
+
+
+def _strip_png(data: bytes):
+    chunks, i = [data[:8]], 8
+    while i + 8 <= len(data):
+        end = i + 12 + int.from_bytes(data[i : i + 4], "big")
+        if data[i + 4 : i + 8] not in PNG_METADATA_CHUNKS:
+            chunks.append(data[i:end])
+        i = end
+    return b"".join(chunks)
+
+
+def _strip_webp(data: bytes):
+    chunks, i = [], 12
+    while i + 8 <= len(data):
+        size = int.from_bytes(data[i + 4 : i + 8], "little")
+        end = i + 8 + size + (size & 1)
+        fourcc, chunk = data[i : i + 4], data[i:end]
+        if fourcc == b"VP8X":
+            chunk = chunk[:8] + bytes([chunk[8] & ~0x0C]) + chunk[9:]  # clear the EXIF and XMP flags
+        if fourcc not in WEBP_METADATA_CHUNKS:
+            chunks.append(chunk)
+        i = end
+    body = b"WEBP" + b"".join(chunks)
+    return b"RIFF" + len(body).to_bytes(4, "little") + body
+
+
+def strip_image_metadata(path: str):
+    """
+    Removes EXIF (GPS, camera, timestamps), XMP, IPTC and text chunks from an image in place without decoding
+    its pixels, so the stored original stays byte-for-byte the same image. JPEGs keep their orientation tag
+    and ICC profile. Only the header is parsed here; resizing happens in the process_image pool.
+    """
+    try:
+        with Image.open(path) as image:
+            fmt = image.format
+            orientation = image.getexif().get(0x0112, 1) if fmt == "JPEG" else 1
+        with open(path, "rb") as file:
+            data = file.read()
+        if fmt == "JPEG":
+            stripped = _strip_jpeg(data, orientation)
+        elif fmt == "PNG":
+            stripped = _strip_png(data)
+        elif fmt == "WEBP":
+            stripped = _strip_webp(data)
+        else:
+            raise ValueError(fmt)
+    except Exception:
+        raise Exception("Invalid image", 400)
+    if stripped == data:
+        return
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".strip-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(stripped)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def make_image_variants(path: str, widths):
+    """
+    Writes WebP and JPEG copies of an image at each width, never wider than the original.
+    Runs in a worker process. Metadata (EXIF, GPS, ICC) is dropped because only pixels are re-encoded;
+    the orientation tag is applied first so phone photos stay upright.
+    """
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "P") else "RGB")
+    done = []
+    for width in sorted({min(width, image.width) for width in widths}):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        resized.save(variant_path(path, width, "webp"), "WEBP", quality=IMAGE_QUALITY, method=4)
+        flat = resized
+        if resized.mode == "RGBA":
+            flat = Image.new("RGB", resized.size, (255, 255, 255))
+            flat.paste(resized, mask=resized.getchannel("A"))
+        flat.save(variant_path(path, width, "jpg"), "JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+        done.append(str(width))
+    return {"width": image.width, "height": image.height, "variants": ",".join(done)}
+
+
+def process_image(path: str, widths, on_done):
+    """
+    Builds image variants in the process pool and calls on_done(info) on a background thread when they exist.
+    Paths that are not resizable images are ignored. The original file is left untouched.
+    Workers are spawned, not forked: forking this threaded process could copy a lock some other thread holds.
+    """
+    if not path or path.rsplit(".", 1)[-1].lower() not in IMAGE_EXTENSIONS:
+        return None
+    global _image_pool
+    if _image_pool is None:
+        with _image_pool_lock:
+            if _image_pool is None:
+                _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    future = _image_pool.submit(make_image_variants, path, tuple(widths))
+
+    def finished(future):
+        if future.exception():
+            print("IMAGE ERROR:", path, future.exception(), flush=True)
+        else:
+            run_in_background(on_done, future.result())
+
+    future.add_done_callback(finished)
+    return future
+
+
 ##############################
 # EMAIL
 ##############################
+def smtp_credentials():
+    return os.getenv("SMTP_USER", ""), os.getenv("SMTP_PASSWORD", "")
+
+
+def build_email(sender_email: str, to_email: str, subject: str, template: str):
+    message = MIMEMultipart()
+    message["From"] = "VinylVibes"
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.attach(MIMEText(template, "html"))
+    return message.as_string()
+
+
+class SmtpSender:
+    """
+    One SMTP connection kept open between messages. Not thread-safe: each delivery thread owns one.
+    A connection the server dropped while idle is reopened once before the send counts as failed.
+    """
+
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
+
+    def send(self, to_email: str, subject: str, template: str):
+        sender_email, password = smtp_credentials()
+        message = build_email(sender_email, to_email, subject, template)
+        if self._server and time.monotonic() - self._last_used > SMTP_IDLE_TIMEOUT:
+            self.close()
+        reused = self._server is not None
+        try:
+            self._connect(sender_email, password).sendmail(sender_email, to_email, message)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            if not reused:
+                raise
+            self._connect(sender_email, password).sendmail(sender_email, to_email, message)
+        except Exception:
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def _connect(self, sender_email, password):
+        if self._server is None:
+            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            try:
+                if SMTP_STARTTLS:
+                    server.starttls()
+                if password:
+                    server.login(sender_email, password)
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+        return self._server
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+
+class EmailQueue:
+    """
+    Bounded queue of outgoing emails drained by a few delivery threads, each reusing its own SMTP connection.
+    Failed sends are retried with exponential backoff up to EMAIL_MAX_ATTEMPTS, then dropped and counted.
+    shutdown() lets the workers finish what is queued (within a timeout) before closing their connections.
+    """
+
+    def __init__(self, workers=EMAIL_WORKERS, maxsize=EMAIL_QUEUE_SIZE):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.counters = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0, "rejected": 0, "waiting_retry": 0}
+
+    def enqueue(self, to_email: str, subject: str, template: str):
+        if self._closed:
+            self._count("rejected")
+            raise Exception("Email queue closed", 503)
+        self._start()
+        try:
+            self._queue.put((to_email, subject, template, 1), timeout=EMAIL_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self._count("rejected")
+            raise Exception("Email queue full", 503)
+        self._count("enqueued")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, depth=self._queue.qsize(), capacity=self._queue.maxsize, workers=len(self._threads))
+
+    def drain(self, timeout=None):
+        """
+        Waits until every queued email, including scheduled retries, is sent or has failed. Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                busy = self._queue.unfinished_tasks or self.counters["waiting_retry"]
+            if not busy:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def shutdown(self, timeout=EMAIL_SHUTDOWN_TIMEOUT):
+        self._closed = True
+        drained = self.drain(timeout) if self._threads else True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        return drained
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self.counters[name] += delta
+
+    def _start(self):
+        if len(self._threads) < self.workers:
+            with self._lock:
+                while len(self._threads) < self.workers:
+                    thread = threading.Thread(target=self._work, name=f"email-{len(self._threads)}", daemon=True)
+                    self._threads.append(thread)
+                    thread.start()
+
+    def _work(self):
+        sender = SmtpSender()
+        while True:
+            try:
+                item = self._queue.get(timeout=SMTP_IDLE_TIMEOUT)
+            except queue.Empty:
+                sender.close()
+                continue
+            if item is None:
+                sender.close()
+                self._queue.task_done()
+                return
+            to_email, subject, template, attempt = item
+            try:
+                sender.send(to_email, subject, template)
+                self._count("sent")
+            except Exception as ex:
+                self._retry(item, ex)
+            finally:
+                self._queue.task_done()
+
+    def _retry(self, item, ex):
+        to_email, subject, template, attempt = item
+        if attempt >= EMAIL_MAX_ATTEMPTS:
+            self._count("failed")
+            print(f"EMAIL FAILED after {attempt} attempts to {to_email}:", ex, flush=True)
+            return
+        self._count("waiting_retry")
+        timer = threading.Timer(EMAIL_RETRY_BASE * 2 ** (attempt - 1), self._requeue, ((to_email, subject, template, attempt + 1),))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, item):
+        try:
+            self._queue.put_nowait(item)
+            self._count("retried")
+        except queue.Full:
+            self._count("failed")
+            print("EMAIL DROPPED, queue full:", item[0], flush=True)
+        finally:
+            self._count("waiting_retry", -1)  # after the put, so drain() never sees the item in neither place
+
+
+email_queue = EmailQueue()
+atexit.register(email_queue.shutdown)
+
+
 def send_email(to_email: str, subject: str, template: str):
     """
-    Sends an email via SMTP. Falls back to console logging if credentials are missing.
+    Queues an email for background delivery over SMTP. Falls back to console logging if credentials are missing.
     """
-    sender_email = os.getenv("SMTP_USER", "")
-    password = os.getenv("SMTP_PASSWORD", "")
+    sender_email, password = smtp_credentials()
 
     if not sender_email or not password:
         print(f"[email disabled] To: {to_email} | Subject: {subject}")
         print(template)
         return "email logged"
 
+    email_queue.enqueue(to_email, subject, template)
+    return "email queued"
+
+
+##############################
+# OUTBOX
+##############################
+def add_to_outbox(cursor, kind: str, payload: dict):
+    """
+    Records a side effect in the outbox using the caller's cursor, so it commits or rolls back with the state change.
+    """
+    now = int(time.time())
+    cursor.execute(
+        "INSERT INTO outbox (outbox_kind, outbox_payload, outbox_available_at, outbox_created_at) VALUES (%s, %s, %s, %s)",
+        (kind, json.dumps(payload), now, now),
+    )
+
+
+def deliver_outbox_entry(sender, kind: str, payload: dict):
+    if kind == "email":
+        sender_email, password = smtp_credentials()
+        if not sender_email or not password:
+            print(f"[email disabled] To: {payload['to']} | Subject: {payload['subject']}")
+            return
+        sender.send(payload["to"], payload["subject"], payload["template"])
+    else:
+        raise Exception(f"Unknown outbox kind {kind}")
+
+
+_outbox_sender = SmtpSender()
+_outbox_lock = threading.Lock()
+
+
+def relay_outbox():
+    """
+    Delivers due outbox rows in batches of OUTBOX_BATCH_SIZE, deleting each row once it is delivered (at least once).
+    FOR UPDATE SKIP LOCKED lets relays in other processes take other rows instead of waiting.
+    Failures are retried with backoff until EMAIL_MAX_ATTEMPTS, then parked with outbox_failed_at set.
+    """
+    if not _outbox_lock.acquire(blocking=False):
+        return
+    conn = None
+    try:
+        conn = get_pool().checkout()
+        cursor = InstrumentedCursor(conn.cursor(dictionary=True))
+        while True:
+            now = int(time.time())
+            cursor.execute(
+                """
+                SELECT outbox_pk, outbox_kind, outbox_payload, outbox_attempts FROM outbox
+                WHERE outbox_failed_at = 0 AND outbox_available_at <= %s
+                ORDER BY outbox_pk LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (now, OUTBOX_BATCH_SIZE),
+            )
+            rows = cursor.fetchall()
+            for row in rows:
+                try:
+                    deliver_outbox_entry(_outbox_sender, row["outbox_kind"], json.loads(row["outbox_payload"]))
+                    cursor.execute("DELETE FROM outbox WHERE outbox_pk = %s", (row["outbox_pk"],))
+                except Exception as ex:
+                    attempts = row["outbox_attempts"] + 1
+                    print(f"OUTBOX {row['outbox_pk']} attempt {attempts} failed:", ex, flush=True)
+                    cursor.execute(
+                        "UPDATE outbox SET outbox_attempts = %s, outbox_available_at = %s, outbox_failed_at = %s WHERE outbox_pk = %s",
+                        (attempts, now + int(EMAIL_RETRY_BASE * 2 ** attempts), now if attempts >= EMAIL_MAX_ATTEMPTS else 0, row["outbox_pk"]),
+                    )
+            conn.commit()
+            if len(rows) < OUTBOX_BATCH_SIZE:
+                break
+        cursor.close()
+    finally:
+        if conn is not None:
+            conn.close()
+        _outbox_lock.release()
+
+
+##############################
+# ASSETS
+##############################
+_asset_manifest = None  # set by load_assets() on the first static_url() call
+_asset_lock = threading.Lock()
+CSS_TOKENS = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|([^"'/]+|/)""", re.S)
+
+
+def minify_css(text: str):
+    """
+    Drops comments and collapses whitespace around CSS punctuation, leaving quoted strings untouched.
+    """
+    out = []
+    for string, comment, code in CSS_TOKENS.findall(text):
+        if string:
+            out.append(string)
+        elif code:
+            code = re.sub(r"\s+", " ", code)
+            code = re.sub(r"\s*([{};,>])\s*", r"\1", code)
+            out.append(re.sub(r":\s+", ":", code))
+    return "".join(out).replace(";}", "}").strip()
+
+
+JS_KEYWORDS_BEFORE_REGEX = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw", "instanceof", "yield", "await"}
+
+
+def _js_quoted_end(text: str, i: int):
+    quote, j = text[i], i + 1
+    while j < len(text) and text[j] != quote and text[j] != "\n":
+        j += 2 if text[j] == "\\" else 1
+    return j + 1
+
+
+def _js_regex_end(text: str, i: int):
+    j, in_class = i + 1, False
+    while j < len(text) and text[j] != "\n":
+        char = text[j]
+        if char == "\\":
+            j += 2
+            continue
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            j += 1
+            break
+        j += 1
+    while j < len(text) and (text[j].isalnum() or text[j] in "_$"):
+        j += 1
+    return j
+
+
+def _js_word_char(char: str):
+    return char.isalnum() or char in "_$\\"
+
+
+def minify_js(text: str):
+    """
+    Drops comments and collapses whitespace using a small tokenizer that knows strings, template literals
+    (with nested ${...}), regex literals and comments, so none of those are ever rewritten.
+    Line breaks between statements are kept, so automatic semicolon insertion still works.
+    """
+    out = []
+    pending = ""  # whitespace seen since the last token: "", " " or "\n"
+    previous = ""  # last significant token, to tell a regex literal from a division
+    templates = []  # open { } depth inside each ${...} of the template literals being read
+    i, n = 0, len(text)
+
+    def emit(token):
+        nonlocal pending
+        if pending and out:
+            last, first = out[-1][-1], token[0]
+            if pending == "\n":
+                out.append("\n")
+            elif (_js_word_char(last) and _js_word_char(first)) or (last == first and last in "+-/") or (last.isdigit() and first == "."):
+                out.append(" ")
+        pending = ""
+        out.append(token)
+
+    while i < n:
+        char = text[i]
+        if char.isspace():
+            j = i
+            while j < n and text[j].isspace():
+                j += 1
+            pending = "\n" if "\n" in text[i:j] or pending == "\n" else " "
+            i = j
+        elif char in "\"'":
+            j = _js_quoted_end(text, i)
+            emit(text[i:j])
+            previous, i = "a", j
+        elif char == "`" or (char == "}" and templates and templates[-1] == 0):
+            if char == "}":
+                templates.pop()
+            j = i + 1
+            previous = "a"
+            while j < n:
+                if text[j] == "\\":
+                    j += 2
+                elif text[j] == "`":
+                    j += 1
+                    break
+                elif text.startswith("${", j):
+                    j += 2
+                    templates.append(0)
+                    previous = "("
+                    break
+                else:
+                    j += 1
+            emit(text[i:j])
+            i = j
+        elif text.startswith("//", i):
+            j = text.find("\n", i)
+            i = n if j < 0 else j
+        elif text.startswith("/*", i):
+            j = text.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            pending = "\n" if "\n" in text[i:j] or pending == "\n" else " "
+            i = j
+        elif char == "/" and (not previous or previous in JS_KEYWORDS_BEFORE_REGEX or previous in "(,=:[!&|?{};+-*%<>~^"):
+            j = _js_regex_end(text, i)
+            emit(text[i:j])
+            previous, i = "a", j
+        elif _js_word_char(char):
+            j = i
+            while j < n and _js_word_char(text[j]):
+                j += 1
+            word = text[i:j]
+            emit(word)
+            previous, i = word if word in JS_KEYWORDS_BEFORE_REGEX else "a", j
+        else:
+            if templates and char == "{":
+                templates[-1] += 1
+            elif templates and char == "}":
+                templates[-1] -= 1
+            emit(char)
+            previous, i = char, i + 1
+    return "".join(out) + "\n"
+
+
+def _write_bytes_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
     try:
-        message = MIMEMultipart()
-        message["From"] = "VinylVibes"
-        message["To"] = to_email
-        message["Subject"] = subject
-        message.attach(MIMEText(template, "html"))
-
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, password)
-            server.sendmail(sender_email, to_email, message.as_string())
-
-        return "email sent"
-    except Exception as ex:
-        print("email error", ex)
-        raise Exception("cannot send email", 500)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build_assets(static_folder: str = "static"):
+    """
+    Minifies ASSET_FILES into ASSET_BUILD_FOLDER under content-hashed names (app.<sha256[:12]>.css),
+    with .gz and .br copies next to them.
+    Each output is checked on its own, so a missing .gz or .br is written even when the base file exists.
+    Writes manifest.json and makes static_url() use the new names.
+    """
+    global _asset_manifest
+    os.makedirs(ASSET_BUILD_FOLDER, exist_ok=True)
+    manifest = {}
+    for name in ASSET_FILES:
+        with open(os.path.join(static_folder, name), "r", encoding="utf-8") as file:
+            source = file.read()
+        minified = (minify_css(source) if name.endswith(".css") else minify_js(source)).encode("utf-8")
+        stem, ext = name.rsplit(".", 1)
+        hashed = f"{stem}.{hashlib.sha256(minified).hexdigest()[:12]}.{ext}"
+        path = os.path.join(ASSET_BUILD_FOLDER, hashed)
+        outputs = {
+            path + ".gz": lambda: gzip.compress(minified, compresslevel=9, mtime=0),
+            path + ".br": lambda: brotli.compress(minified, quality=11),
+            path: lambda: minified,
+        }
+        for output, encode in outputs.items():
+            if not os.path.exists(output):
+                _write_bytes_atomic(output, encode())
+        manifest[name] = hashed
+    write_atomic(os.path.join(ASSET_BUILD_FOLDER, "manifest.json"), json.dumps(manifest, indent=2))
+    _asset_manifest = manifest
+    return manifest
+
+
+def load_assets():
+    """
+    Builds the manifest from the current sources, so a manifest.json left by an earlier deploy is never reused.
+    Cheap when nothing changed: the hashes are recomputed and existing outputs are kept.
+    On failure static_url() falls back to the unversioned files.
+    """
+    global _asset_manifest
+    with _asset_lock:
+        if _asset_manifest is None:
+            try:
+                build_assets()
+            except Exception as ex:
+                print("ASSET BUILD ERROR:", ex, flush=True)
+                _asset_manifest = {}
+        return _asset_manifest
+
+
+def static_url(filename: str):
+    """
+    Assets are built on the first call rather than on import.
+    """
+    manifest = _asset_manifest if _asset_manifest is not None else load_assets()
+    hashed = manifest.get(filename)
+    if hashed:
+        return "/assets/" + hashed
+    return "/static/" + filename